@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+
+"""
+Argument Lexer Stress Benchmark
+
+Times Session.parse_app_args on pathological command lines, such as a
+generalization with thousands of subclasses or a name thousands of
+characters long, and compares it with the regular expression extractor it
+replaced.  Every line is also checked to produce the same arg_map (or the
+same syntax error) either way.
+
+usage: bench_args.py [<largest size>]
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import re
+import sys
+import time
+
+# Local modules and resources are found relative to the source code directory
+os.chdir( os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+sys.path.insert( 0, os.getcwd() )
+_MODULE_DIR = os.path.abspath("../Modules") # mi_Error, as for mi_API
+if _MODULE_DIR not in sys.path:
+    sys.path.append(_MODULE_DIR)
+
+# Local
+from mi_Error import *
+from mi_Session import Session, lex_args
+
+DEFAULT_SIZE = 4000
+
+# The extractor replaced by lex_args, kept as the reference
+ARG_EXTRACT = (
+        ( lambda r: ( r.group('arg'), [x.strip() for x in r.group('value').split(",")],
+            r.end('value'), 'list' ),
+            re.compile( r'^-(?P<arg>\w+)\s+(?P<value>\w[\w\/\.\s]*,\s*\w[\w\/\.\s,]*)' ) ),
+        ( lambda r: ( r.group('arg'), r.group('value').strip(), r.end('value'), 'value' ),
+            re.compile( r'^-(?P<arg>\w+)\s+(?P<value>\w[\w\/\.\s]*)' ) ),
+        ( lambda r: ( r.group('arg'), True, r.end('arg'), 'flag' ),
+            re.compile( r'^-(?P<arg>\w+)\s*(-.*)?$' ) )
+    )
+
+def regex_args( arg_text ):
+    """
+    Returns the list of ( arg, value, pattern ) triples found by the
+    regular expression extractor.
+
+    """
+    items = []
+    arg_text = arg_text.strip()
+    while arg_text:
+        for f, p in ARG_EXTRACT:
+            r = p.match( arg_text )
+            if r:
+                a, v, match_end, pattern = f( r )
+                arg_text = None if match_end >= len( arg_text ) - 1 \
+                    else arg_text[match_end:].lstrip()
+                items.append( ( a, v, pattern ) )
+                break
+        else:
+            raise mi_Syntax_Error( "<op> <subject> [<args>]" )
+    return items
+
+def stress_lines( size ):
+    """
+    Returns ( description, arg text ) pairs that are slow to parse by
+    regular expression as size grows.
+
+    """
+    subclasses = ", ".join( "Sub Class {}".format( i ) for i in range( size ) )
+    return [
+        ( "{} subclasses".format( size ),
+            "-superclass Aircraft -subclasses " + subclasses ),
+        ( "{} subclasses, bad last name".format( size ),
+            "-superclass Aircraft -subclasses " + subclasses + ", Bad!Name -a b" ),
+        ( "{} args".format( size ),
+            " ".join( "-arg{} value {}".format( i, i ) for i in range( size ) ) ),
+        ( "{} char name".format( size * 10 ),
+            "-name " + "Air Traffic " * size + "-alias ATC" ),
+        ( "{} char name, trailing comma".format( size * 10 ),
+            "-name " + "Air Traffic " * size + "," ),
+        ( "{} flags".format( size ), " ".join( "-f{}".format( i ) for i in range( size ) ) ),
+    ]
+
+def check_examples():
+    """
+    Checks lex_args against the reference on short, tricky lines.
+
+    """
+    examples = [ "", "-f", "-name Foo", "-name Foo!", "-name Foo !", "-a b, c",
+        "-a b,", "-a b , c -d", "-a b,c,,d -e f", "-a  b c  -force -x y",
+        "-name a/b.c", "-a -b", "-a b -", "-a !", "- a", "x", "-a b-c",
+        "-a b, -c d", "-a b,  c, d!e", "-a b\t, c" ]
+    for text in examples:
+        assert_same( text )
+
+def assert_same( text ):
+    """
+    Raises AssertionError unless lex_args and the reference agree on text.
+
+    """
+    def run( parse ):
+        try:
+            return parse( text )
+        except mi_Syntax_Error:
+            return "syntax error"
+    expected = run( regex_args )
+    found = run( lambda t: list( lex_args( t ) ) )
+    assert found == expected, "{!r}: {!r} != {!r}".format( text[:60], found, expected )
+
+def timed( parse, text ):
+    start = time.perf_counter()
+    try:
+        parse( text )
+    except mi_Syntax_Error:
+        pass
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    largest = int( sys.argv[1] ) if len( sys.argv ) > 1 else DEFAULT_SIZE
+
+    check_examples()
+    print( "{:<40}{:>12}{:>12}".format( "line", "lexer ms", "regex ms" ) )
+    size = largest // 8
+    while size <= largest:
+        for description, text in stress_lines( size ):
+            assert_same( text )
+            print( "{:<40}{:>12.2f}{:>12.2f}".format( description,
+                timed( Session.parse_app_args, text ) * 1000,
+                timed( regex_args, text ) * 1000 ) )
+        size *= 2
@@ -0,0 +1,284 @@
+#! /usr/bin/env python
+
+"""
+End to End Stage Benchmark
+
+Runs a model script, either read from a file or generated by gen_script.py,
+and times each stage of every command separately:
+
+    parse       Session.parse_app_args, command line text to arg map
+    translate   API.command_to_call, arg map to API call
+    execute     db_Session.exec_command, API call sent to the database
+
+The whole script is run in a single transaction that is rolled back at the
+end, so the database is left as it was and the benchmark can be repeated.
+Use -no-db to time parsing and translation only, or -memory to execute
+against the in memory stand-in instead of the database.
+
+With -bulk N calls are sent N at a time, as by the editor's -bulk option,
+each call's execute time being its share of its chunk.  Runs of calls of the
+same shape are coalesced into one statement if -coalesce is given, so
+comparing the two measures the gain on a script such as Test/atc.mi.
+
+The results are written as JSON so that runs of different versions can be
+compared with -compare.
+
+usage: bench_stages.py [-f <script>] [<gen_script.py shape options>]
+                       [-dsn <connection string> | -memory | -no-db]
+                       [-bulk N [-coalesce]]
+                       [-o <results.json>] [-compare <earlier results.json>]
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+# Local modules and resources are found relative to the source code directory
+launch_dir = os.getcwd()
+os.chdir( os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+sys.path.insert( 0, os.getcwd() )
+sys.path.insert( 1, os.path.join( os.getcwd(), "Bench" ) )
+_MODULE_DIR = os.path.abspath("../Modules") # mi_Error, as for mi_API
+if _MODULE_DIR not in sys.path:
+    sys.path.append(_MODULE_DIR)
+
+# Local
+from mi_Error import *
+from mi_API import API
+from mi_Session import Session, lex_args, strip_comment_ws, OP, SUB, ARGS
+from mi_Pool import db_Pool, DEFAULT_DSN
+from mi_Memory_DB import mem_Model, mem_Session
+import mi_RDB
+from gen_script import shape_args, generate_script
+
+STAGES = ( 'parse', 'translate', 'execute' )
+
+def option_value( args, flag ):
+    """
+    Removes an option and its value from args, returning the value or None.
+
+    """
+    if flag not in args:
+        return None
+    i = args.index( flag )
+    if i + 1 >= len( args ):
+        print( "Option {} requires a value.".format( flag ) )
+        exit(2)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+def focus( api, arg_text ):
+    """
+    Applies a focus command, the only UI command found in generated scripts.
+
+    """
+    arg_map = { a:v for a, v, pattern in lex_args( arg_text ) }
+    if 'c' in arg_map:
+        api.clear_default( None if arg_map['c'] is True else arg_map['c'] )
+    elif 's' in arg_map and 'v' in arg_map:
+        api.set_default( arg_map['s'], arg_map['v'] )
+
+def summarize( times ):
+    """
+    Returns the statistics for one stage given the time taken by each command.
+
+    """
+    if not times:
+        return { 'count':0 }
+    times = sorted( times )
+    total = sum( times )
+    n = len( times )
+    return {
+        'count':n,
+        'total_s':total,
+        'per_s':n / total if total else None,
+        'mean_us':total / n * 1e6,
+        'p50_us':times[n // 2] * 1e6,
+        'p95_us':times[min( n - 1, n * 95 // 100 )] * 1e6,
+        'max_us':times[-1] * 1e6
+    }
+
+def send( editor, chunk, times ):
+    """
+    Executes a chunk of calls, recording each call's share of the time.
+    Returns the number of calls that failed.
+
+    """
+    if not chunk:
+        return 0
+    start = time.perf_counter()
+    try:
+        editor.exec_batch( chunk, False )
+        failed = 0
+    except mi_Error:
+        failed = 1 # The calls after it in the chunk aren't made
+    times['execute'] += [ ( time.perf_counter() - start ) / len( chunk ) ] * len( chunk )
+    del chunk[:]
+    return failed
+
+def run( lines, editor, bulk=None ):
+    """
+    Runs each command line, returning the time each stage took per command
+    and the number of commands that failed.  With bulk, calls without output
+    are sent in chunks of that many.
+
+    """
+    api = API( "miUML Editor", "UI_", os.path.join( "Resources", "api_def.mi" ) )
+    times = { stage:[] for stage in STAGES }
+    failed = 0
+    clock = time.perf_counter
+    chunk = [] # ( call, pvals, shape )
+
+    if editor:
+        editor.begin_batch()
+    try:
+        for line in lines:
+            line = strip_comment_ws( line )
+            if not line:
+                continue
+            term = line.split( None, 2 )
+            if term[OP] in ( 'focus', 'f' ):
+                focus( api, line.split( None, 1 )[1] if len( term ) > 1 else "" )
+                continue
+            arg_text = term[ARGS] if len( term ) > 2 else ""
+            try:
+                start = clock()
+                arg_map = Session.parse_app_args( arg_text )
+                parsed = clock()
+                command = api.command_to_call( term[SUB], term[OP], arg_map )
+                translated = clock()
+                times['parse'].append( parsed - start )
+                times['translate'].append( translated - parsed )
+                if editor and bulk and not command['ovals']:
+                    chunk.append( ( command['call'], command['pvals'], command['shape'] ) )
+                    if len( chunk ) >= bulk:
+                        failed += send( editor, chunk, times )
+                elif editor:
+                    failed += send( editor, chunk, times ) if bulk else 0
+                    translated = clock()
+                    editor.exec_command( command['call'], command['pvals'],
+                            command['ovals'], False, False, command['shape'] )
+                    times['execute'].append( clock() - translated )
+            except mi_Error:
+                failed += 1
+        if editor and bulk:
+            failed += send( editor, chunk, times )
+    finally:
+        if editor:
+            editor.end_batch( commit=False ) # Leave the database as it was
+            editor.close()
+    return times, failed
+
+def version():
+    """
+    Returns the git commit of the source code, if known.
+
+    """
+    try:
+        return subprocess.check_output( [ 'git', 'rev-parse', '--short', 'HEAD' ],
+            stderr=subprocess.DEVNULL ).decode().strip()
+    except Exception:
+        return None
+
+def compare( results, earlier ):
+    """
+    Prints the change in commands per second of each stage since an earlier run.
+
+    """
+    print( "\nCompared with {} ({})".format( earlier.get('version'), earlier.get('time') ) )
+    for stage in STAGES:
+        now, then = results['stages'][stage].get('per_s'), earlier['stages'].get( stage, {} ).get('per_s')
+        if now and then:
+            print( "{:<12}{:>+10.1f}%".format( stage, ( now / then - 1 ) * 100 ) )
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    script = option_value( args, '-f' )
+    output = option_value( args, '-o' )
+    earlier = option_value( args, '-compare' )
+    dsn = option_value( args, '-dsn' ) or DEFAULT_DSN
+    bulk = option_value( args, '-bulk' )
+    bulk = int( bulk ) if bulk else None
+    coalesce = '-coalesce' in args
+    if coalesce:
+        args.remove( '-coalesce' )
+    backend = 'postgres'
+    for flag, name in ( ( '-no-db', None ), ( '-memory', 'memory' ) ):
+        if flag in args:
+            args.remove( flag )
+            backend = name
+    shape = shape_args( args )
+    if args:
+        print( __doc__.split( "usage: " )[1].split( "\n\n" )[0] )
+        exit(2)
+
+    if script:
+        with open( os.path.join( launch_dir, script ) ) as f:
+            lines = f.read().splitlines()
+    else:
+        lines = generate_script( shape )
+
+    if backend == 'postgres':
+        editor = mi_RDB.db_Session( pool=db_Pool( dsn ) )
+        if coalesce:
+            editor.coalesce_min = mi_RDB.COALESCE_MIN
+    elif backend == 'memory':
+        editor = mem_Session( mem_Model() )
+    else:
+        editor = None
+    start = time.perf_counter()
+    times, failed = run( lines, editor, bulk )
+    elapsed = time.perf_counter() - start
+
+    results = {
+        'version':version(),
+        'time':time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+        'python':platform.python_version(),
+        'script':script,
+        'shape':None if script else shape,
+        'backend':backend,
+        'database':dsn if backend == 'postgres' else None,
+        'bulk':bulk,
+        'coalesce':coalesce if bulk else None,
+        'failed':failed,
+        'elapsed_s':elapsed,
+        'stages':{ stage:summarize( times[stage] ) for stage in STAGES }
+    }
+
+    print( "{:<12}{:>10}{:>14}{:>12}{:>12}{:>12}".format(
+        "stage", "commands", "commands/s", "mean us", "p95 us", "max us" ) )
+    for stage in STAGES:
+        r = results['stages'][stage]
+        if r['count']:
+            print( "{:<12}{:>10}{:>14.0f}{:>12.1f}{:>12.1f}{:>12.1f}".format( stage,
+                r['count'], r['per_s'] or 0, r['mean_us'], r['p95_us'], r['max_us'] ) )
+    if failed:
+        print( "{} commands failed".format( failed ) )
+    if bulk and editor and editor.bulk_report():
+        print( editor.bulk_report() )
+
+    if earlier:
+        with open( os.path.join( launch_dir, earlier ) ) as f:
+            compare( results, json.load( f ) )
+    if output:
+        with open( os.path.join( launch_dir, output ), 'w' ) as f:
+            json.dump( results, f, indent=4, sort_keys=True )
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+
+"""
+Translation Microbenchmark
+
+Generates a large model script in memory and measures how many commands per
+second API.command_to_call can translate.  Only translation is timed, the
+arg maps are prepared beforehand and nothing is sent to the database.
+
+The commands are translated -repeat times, 5 by default, and the fastest
+run is reported, so that a busy machine disturbs the result less.  The
+results are written as JSON with -o, and compared with those of an earlier
+version with -compare, as by bench_stages.py.
+
+usage: bench_translate.py [<number of lines>] [-repeat N]
+                          [-o <results.json>] [-compare <earlier results.json>]
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+# Local modules and resources are found relative to the source code directory
+launch_dir = os.getcwd()
+os.chdir( os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+sys.path.insert( 0, os.getcwd() )
+
+# Local
+from mi_API import API
+
+DEFAULT_LINES = 100000
+DEFAULT_REPEAT = 5
+
+def option_value( args, flag ):
+    """
+    Removes an option and its value from args, returning the value or None.
+
+    """
+    if flag not in args:
+        return None
+    i = args.index( flag )
+    if i + 1 >= len( args ):
+        print( "Option {} requires a value.".format( flag ) )
+        exit(2)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+def version():
+    """
+    Returns the git revision of the source code, if it can be found.
+
+    """
+    try:
+        return subprocess.check_output( [ 'git', 'rev-parse', '--short', 'HEAD' ],
+            stderr=subprocess.DEVNULL ).decode().strip()
+    except Exception:
+        return None
+
+def generate_commands( n ):
+    """
+    Returns n ( subject, op, arg_map ) commands shaped like a typical model
+    script: each class gets a handful of attributes, with the occasional
+    association, generalization and query mixed in.  Subject aliases vary
+    as they do in hand written scripts.
+
+    """
+    commands = []
+    c = 0
+    while len( commands ) < n:
+        c += 1
+        cname = "Class {}".format( c )
+        commands.append( ( 'class', 'new', { 'name':cname, 'alias':"C{}".format( c ) } ) )
+        for a, subject in enumerate( ( 'attr', 'a', 'attribute', 'attr', 'a' ) ):
+            commands.append( ( subject, 'new',
+                { 'name':"Attribute {}".format( a ), 'type':'name', 'c':cname } ) )
+        if c > 1:
+            commands.append( ( 'brel', 'new', {
+                'aclass':cname, 'pclass':"Class {}".format( c - 1 ),
+                'aphrase':'refers to', 'pphrase':'is referred to by', 'amult':'M' } ) )
+        if c % 10 == 0:
+            commands.append( ( 'gen', 'new', { 'superclass':cname,
+                'subclasses':[ "Sub {} {}".format( c, s ) for s in range( 3 ) ] } ) )
+            commands.append( ( 'c', 'show', {} ) )
+    return commands[:n]
+
+def run( api, commands ):
+    """
+    Returns the time taken to translate every command.
+
+    """
+    start = time.perf_counter()
+    for subject, op, arg_map in commands:
+        api.command_to_call( subject, op, dict( arg_map ) )
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    output = option_value( args, '-o' )
+    earlier = option_value( args, '-compare' )
+    repeat = option_value( args, '-repeat' )
+    repeat = int( repeat ) if repeat else DEFAULT_REPEAT
+    n = int( args.pop( 0 ) ) if args and args[0].isdigit() else DEFAULT_LINES
+    if args or repeat < 1:
+        print( __doc__.split( "usage: " )[1].split( "\n\n" )[0] )
+        exit(2)
+
+    api = API( "miUML Editor", "UI_", os.path.join( "Resources", "api_def.mi" ) )
+    api.set_default( 'domain', 'Air Traffic Control' )
+    api.set_default( 'subsys', 'Main' )
+    commands = generate_commands( n )
+
+    runs = [ run( api, commands ) for r in range( repeat ) ]
+    elapsed = min( runs )
+    results = {
+        'version':version(),
+        'time':time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+        'python':platform.python_version(),
+        'commands':n,
+        'repeat':repeat,
+        'runs_s':runs,
+        'elapsed_s':elapsed,
+        'per_s':n / elapsed
+    }
+
+    print( "{} commands in {:.3f} s ({:.0f} commands/s), best of {}".format(
+        n, elapsed, n / elapsed, repeat ) )
+
+    if earlier:
+        with open( os.path.join( launch_dir, earlier ) ) as f:
+            then = json.load( f )
+        print( "Compared with {} ({}): {:+.1f}%".format( then.get('version'), then.get('time'),
+            ( results['per_s'] / then['per_s'] - 1 ) * 100 ) )
+        if then.get('commands') != n:
+            print( "Note: it translated {} commands".format( then.get('commands') ) )
+    if output:
+        with open( os.path.join( launch_dir, output ), 'w' ) as f:
+            json.dump( results, f, indent=4, sort_keys=True )
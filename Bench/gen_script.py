@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+
+"""
+Synthetic Model Script Generator
+
+Writes a command script that builds a model of the requested size and shape
+using the same commands found in hand written scripts such as Test/atc.mi.
+Each domain gets a number of subsystems, each subsystem a number of classes
+with attributes, binary associations between neighboring classes and
+generalizations of existing classes into new subclasses.
+
+usage: gen_script.py [-domains N] [-subsystems N] [-classes N] [-attrs N]
+                     [-assocs N] [-gens N] [-subclasses N] [-queries N]
+
+The script is written to standard output.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import sys
+
+# Shape of the generated model
+# Counts other than domains are per domain, subsystem, class or generalization
+DEFAULT_SHAPE = {
+    'domains':1,
+    'subsystems':4, # per domain, in addition to the one each domain starts with
+    'classes':25, # per subsystem
+    'attrs':4, # per class, in addition to its identifier
+    'assocs':20, # per subsystem
+    'gens':3, # per subsystem
+    'subclasses':2, # per generalization
+    'queries':1 # show commands per subsystem
+}
+
+# Class numbers are assigned from each subsystem's range
+SUBSYS_RANGE = 1000
+
+ATTR_TYPES = ( 'name', 'posint', 'nominal', 'name' )
+
+def shape_args( args, shape=None ):
+    """
+    Removes any -<shape count> N options from args and returns the shape
+    they describe, based on the supplied or default shape.
+
+    """
+    shape = dict( shape or DEFAULT_SHAPE )
+    for count in DEFAULT_SHAPE:
+        flag = '-' + count
+        if flag in args:
+            i = args.index( flag )
+            try:
+                shape[count] = int( args[i + 1] )
+            except ( IndexError, ValueError ):
+                print( "Option {} requires a number.".format( flag ), file=sys.stderr )
+                exit(2)
+            del args[i:i + 2]
+    return shape
+
+def generate_script( shape ):
+    """
+    Returns the lines of a script that builds a model of the given shape.
+
+    """
+    s = dict( DEFAULT_SHAPE, **shape ) # for brevity
+    subsys_range = max( SUBSYS_RANGE, s['classes'] + s['gens'] * s['subclasses'] )
+    lines = [ "# Generated model: " + ", ".join(
+        "{} {}".format( s[count], count ) for count in DEFAULT_SHAPE ) ]
+
+    for d in range( 1, s['domains'] + 1 ):
+        domain = "Domain {}".format( d )
+        lines += [ "",
+            "new domain -name {} -alias D{}".format( domain, d ),
+            "focus -s domain -v {}".format( domain ) ]
+
+        for n in range( 1, s['subsystems'] + 1 ):
+            subsys = "Subsystem {} {}".format( d, n )
+            floor = n * subsys_range + 1
+            lines += [ "",
+                "new subsys -name {} -alias D{}S{} -floor {} -ceiling {}".format(
+                    subsys, d, n, floor, floor + subsys_range - 1 ),
+                "focus -s subsys -v {}".format( subsys ) ]
+
+            classes = [ "Class {} {} {}".format( d, n, c ) for c in range( 1, s['classes'] + 1 ) ]
+            for c, cname in enumerate( classes, 1 ):
+                lines.append( "    new class -name {} -alias D{}S{}C{} -id_name ID -id_type nominal".format(
+                    cname, d, n, c ) )
+                if c % 2:
+                    # Both styles of naming the class are common in scripts
+                    lines.append( "    focus -s class -v {}".format( cname ) )
+                    for a in range( 1, s['attrs'] + 1 ):
+                        lines.append( "        new attr -name Attribute {} -type {}".format(
+                            a, ATTR_TYPES[a % len( ATTR_TYPES )] ) )
+                else:
+                    for a in range( 1, s['attrs'] + 1 ):
+                        lines.append( "    new attr -name Attribute {} -type {} -c {}".format(
+                            a, ATTR_TYPES[a % len( ATTR_TYPES )], cname ) )
+            lines.append( "    focus -c class" )
+
+            for r in range( s['assocs'] if len( classes ) > 1 else 0 ):
+                # Chain neighboring classes, wrapping around to add more
+                aclass = classes[r % len( classes )]
+                pclass = classes[( r + 1 + r // len( classes ) ) % len( classes )]
+                lines.append( "    new brel -aclass {} -aphrase refers to -amult {} -pclass {}"
+                    " -pphrase is referred to by -pmult 1".format(
+                        aclass, 'M' if r % 2 else '1', pclass ) )
+
+            for g in range( min( s['gens'], len( classes ) ) if s['subclasses'] > 1 else 0 ):
+                # Each generalization specializes a different existing class
+                superclass = classes[len( classes ) - 1 - g]
+                subclasses = [ "{} Sub {}".format( superclass, i ) for i in range( 1, s['subclasses'] + 1 ) ]
+                aliases = [ "D{}S{}G{}S{}".format( d, n, g, i ) for i in range( 1, s['subclasses'] + 1 ) ]
+                lines.append( "    new gen -superclass {} -subclasses {} -sub_aliases {}".format(
+                    superclass, ", ".join( subclasses ), ", ".join( aliases ) ) )
+
+            for q in range( s['queries'] ):
+                lines.append( "    show class -s {}".format( subsys ) )
+
+        lines.append( "focus -c subsys" )
+    lines.append( "focus -c" )
+    return lines
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    shape = shape_args( args )
+    if args:
+        print( __doc__.split( "usage: " )[1].split( "\n\n" )[0], file=sys.stderr )
+        exit(2)
+    print( "\n".join( generate_script( shape ) ) )
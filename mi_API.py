@@ -22,6 +22,7 @@ Loads and parses an API
 import re
 import sys
 import os
+import functools
 
 # Local
 _MODULE_DIR = os.path.abspath("../Modules")
@@ -29,9 +30,8 @@ if _MODULE_DIR not in sys.path:
     sys.path.append(_MODULE_DIR)
 from mi_Error import *
 from mi_Structured_File import Structured_File
-
-# Diagnostic
-import pdb # debug
+import mi_Structured_File
+import mi_Cache
 
 # Type validation functions
 def check_bool( ui_type, arg ):
@@ -96,6 +96,15 @@ class API:
         self.call_prefix = call_prefix # Prefix fo API calls, ex: "UI_"
         self.cmd_file = cmd_file # Import API from this file, ex: "Resources/api_def.mi"
 
+        # The parsed API is cached until the API definition or the parser changes
+        cache_name = os.path.basename( self.cmd_file )
+        cache_sources = [ self.cmd_file, __file__, mi_Structured_File.__file__ ]
+        parsed = mi_Cache.load( cache_name, cache_sources )
+        if parsed:
+            self.commands, self.ops, self.subjects, self.types = parsed
+            self.compile_plans()
+            return
+
         # Import command and type records without parsing
         spec = Structured_File( self.cmd_file )
 
@@ -109,6 +118,75 @@ class API:
         self.types = {} # Parsed type data
         self.build_types( spec.sections['types'] )
 
+        mi_Cache.save( cache_name, cache_sources,
+                ( self.commands, self.ops, self.subjects, self.types ) )
+
+        self.compile_plans()
+
+    def compile_plans( self ):
+        """
+        Compiles a call plan for each subject op so that translating a command
+        only has to fill in values.  A flat index of every subject name or alias
+        and op leads straight to its plan with a single lookup.
+
+        A plan holds the API function name, the call prefix and, for each
+        parameter in definition order, its precomputed SQL fragment and a
+        validator already bound to the parameter's ui type.  Focus args that can
+        take a UI supplied default are kept as slots that refer directly to the
+        scoping subject's record where the default is set.
+
+        """
+        self.alias = {} # subject name or alias : official subject name
+        self.index = {} # ( subject name or alias, op ) : ( official subject name, plan )
+        for s in self.commands:
+            for op, op_spec in self.commands[s]['ops'].items():
+                plan = {
+                    'api':self.call_prefix + op_spec['api_call'],
+                    'help':op_spec['help'],
+                    'olist':op_spec.get('olist'),
+                    'params':{}, # arg : ( pname, fragment, validator, is_list )
+                    'required':[], # args that must be supplied
+                    'focus':[], # ( arg, scoping subject record ) default slots
+                    'scopes':{}, # pname : subject named, for args naming something that exists
+                    'group':s + ' ' + op # Commands are timed by subject and op
+                }
+                plan['prefix'] = plan['api'] + '('
+                for a, arg_spec in op_spec['args'].items():
+                    # If the parameter name defined by the app is different than the
+                    # arg name, get it (works for both mod and focus args)
+                    pname = arg_spec.get('app', a)
+
+                    # Get the parameter data type expected by the app, which
+                    # for a focus arg is the type of its scoping subject's name
+                    param_type = arg_spec.get('type')
+                    if not param_type:
+                        param_type = self.commands[arg_spec['scope']]['scope']
+
+                    # Get the closest ui type
+                    ui_type = self.types[param_type]
+
+                    # The validator selects an appropriate type validation function.  Normally,
+                    # this is just the ui_type, but set ui_type is a special case as it is
+                    # an actual set and not a Python type class.
+                    validator = functools.partial(
+                            type_check[ ui_type if type( ui_type ) != set else set ], ui_type
+                        )
+
+                    plan['params'][a] = (
+                            pname, "p_{}:=".format( pname ), validator, arg_spec['list']
+                        )
+                    if arg_spec.get('scope'):
+                        plan['focus'].append( ( a, self.commands[ arg_spec['scope'] ] ) )
+                        if not ( op == 'new' and arg_spec['scope'] == s ):
+                            # Not the element being created
+                            plan['scopes'][pname] = arg_spec['scope']
+                    if not arg_spec['optional']:
+                        plan['required'].append( a )
+
+                for name in self.commands[s]['names']:
+                    self.alias[name] = s
+                    self.index[ (name, op) ] = ( s, plan )
+
     def show_help( self, arg_map ):
         """
         Prints out help for app commands.
@@ -132,114 +210,84 @@ class API:
         For diagnostic purposes, the call will be returned as a string.
 
         """
-        # validate the subject
-        if subject not in self.commands:
-            # Check aliases
-            for s in self.commands:
-                if subject in self.commands[s].get('names'):
-                    subject = s
-                    break # skipping else clause
-            else:
+        # Resolve the subject (or any of its aliases) and op in one lookup
+        try:
+            subject, plan = self.index[ (subject, op) ]
+        except KeyError:
+            # validate the subject
+            if subject not in self.alias:
                 raise mi_Bad_Subject( subject )
-
-        # validate the operation
-        if op not in self.commands[subject]['ops']:
+            # validate the operation
+            subject = self.alias[subject]
             raise mi_Bad_Op( ' | '.join( list( self.commands[subject]['ops'].keys() ) ), subject )
 
         # Assert:  subject and op are valid
-        # Weed out any unexpected extra args that the user may have supplied
-        op_spec = self.commands[subject]['ops'][op] # for brevity
-        required_args = set( op_spec['args'].keys() )
-        provided_args = set( arg_map.keys() )
+        params = plan['params'] # for brevity
+
+        # Is help requested?
+        if "help" in arg_map:
+            raise mi_Syntax_Error( plan['help'] ) # Help requested
 
-        # Are args missing or is help requested?
-        if "help" in provided_args:
-            raise mi_Syntax_Error( op_spec['help'] ) # Help requested
-        if provided_args - required_args:
-            raise mi_Syntax_Error( op_spec['help'] ) # Missing args
+        # Weed out any unexpected extra args that the user may have supplied
+        for a in arg_map:
+            if a not in params:
+                raise mi_Syntax_Error( plan['help'] )
 
         # Assert: No unexpected extra arguments
-        # Are there any missing, but expected args?
-        missing_args = required_args - provided_args
-        for m in missing_args:
-            # Is this a focus arg?  If so, a default could have been set by the UI
-            # All focus args have 'scope'
-            mscope = self.commands[subject]['ops'][op]['args'][m].get('scope')
-            if mscope:
-                # Is there a UI supplied default registered?  If so, add it to the arg_map
-                default_value = self.commands[mscope].get('default')
+        # Any missing focus arg may have a default set by the UI, if so, add it to the arg_map
+        for a, scoping_subject in plan['focus']:
+            if a not in arg_map:
+                default_value = scoping_subject.get('default')
                 if default_value:
-                    arg_map[m] = default_value
-                    continue # We've filled in the missing value, move on to next missing arg
+                    arg_map[a] = default_value
 
-            # If the missing argument is not optional, fail with a syntax error
-            if not self.commands[subject]['ops'][op]['args'][m]['optional']:
-                raise mi_Syntax_Error( op_spec['help'] )
+        # If a missing argument is not optional, fail with a syntax error
+        for a in plan['required']:
+            if a not in arg_map:
+                raise mi_Syntax_Error( plan['help'] )
 
         # Assert: arg_map has everything we need to generate a complete api call
 
-        # Generate the db call
-        app_call = 'UI_' + op_spec['api_call'] + r'(' # Start with call
+        # Generate the db call, adding each param supplied in the order defined
+        fragments = []
         pvals = []
-        # Now add any params
-        for a in arg_map:
-
-            # If the parameter name defined by the app is different than the
-            # arg name, get it (works for both mod and focus args)
-            pname = self.commands[subject]['ops'][op]['args'][a].get('app')
-            if not pname:
-                pname = a # Just use the argument name
-                # The arg name matches the app parameter name
-                # If this is a focus arg, use the scope name, otherwise, just us a
-                # pname = self.commands[subject]['ops'][op]['args'][a].get('scope', a)
-                
-            # Get the parameter data type expected by the app
-            param_type = self.commands[subject]['ops'][op]['args'][a].get('type')
-            if not param_type:
-                mscope = self.commands[subject]['ops'][op]['args'][a].get('scope')
-                param_type = self.commands[mscope]['scope']
-
-            # Is this a list of arg values?  For example, list of subclass names
-            is_list = self.commands[subject]['ops'][op]['args'][a].get('list', False)
-            if is_list and type( arg_map[a] ) != list:
-                raise mi_Arg_Type_Error( pname )
-
-            # Get the closest ui type
-            ui_type = self.types[param_type]
-
-            # The validator selects an appropriate type validation function.  Normally,
-            # this is just the ui_type, but set ui_type is a special case as it is
-            # an actual set and not a Python type class.
-            validator = ui_type if type( ui_type ) != set else set
+        shape = [] # ( pname, list length or None ) for each param supplied
+        for a, ( pname, fragment, validator, is_list ) in params.items():
+            if a not in arg_map:
+                continue
 
             if is_list:
+                # Is this a list of arg values?  For example, list of subclass names
+                if type( arg_map[a] ) != list:
+                    raise mi_Arg_Type_Error( pname )
+
                 # We need to validate the type of each element
-                for e in arg_map[a]:
-                    e, type_ok = type_check[validator]( ui_type, e )
+                for i, e in enumerate( arg_map[a] ):
+                    arg_map[a][i], type_ok = validator( e )
                     if not type_ok:  # If any element is bad, we'll throw an error
-                        break
-            else:
-                # We just need to type validate a single value
-                arg_map[a], type_ok = type_check[validator]( ui_type, arg_map[a] )
-
-            if not type_ok:
-                raise mi_Arg_Type_Error( pname )
+                        raise mi_Arg_Type_Error( pname )
 
-            placeholder = "%s" if not is_list else \
-                "array[" + ", ".join( list( ["%s"]*len( arg_map[a] ) ) ) + "]"
                 # [%s, %s, ...] for each element in arg_map[a] list
-
-            app_call += "p_{}:={}, ".format( pname, placeholder )
-            if is_list:
+                fragments.append( fragment + "array[" + ", ".join( ["%s"]*len( arg_map[a] ) ) + "]" )
                 pvals += arg_map[a] # If arg_map[a] is a list we want to unwind it here
                                 # so we use + instead of append
+                shape.append( ( pname, len( arg_map[a] ) ) )
             else:
+                # We just need to type validate a single value
+                arg_map[a], type_ok = validator( arg_map[a] )
+                if not type_ok:
+                    raise mi_Arg_Type_Error( pname )
+
+                fragments.append( fragment + "%s" )
                 pvals.append( arg_map[a] )
+                shape.append( ( pname, None ) )
 
-        app_call = app_call.rstrip(', ') + ')' # Kill the rightmost ',' and add closing paren
+        app_call = plan['prefix'] + ", ".join( fragments ) + ')'
+        # Every call with the same shape can share one server side prepared statement
+        shape = ( plan['api'], tuple( shape ) )
 
-        ovals = self.commands[subject]['ops'][op].get('olist')
-        return { 'call':app_call, 'pvals':pvals, 'ovals':ovals }
+        return { 'call':app_call, 'pvals':pvals, 'ovals':plan['olist'],
+                'shape':shape, 'group':plan['group'] }
 
 
     def get_default_for_subject( self, subject ):
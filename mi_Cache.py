@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+
+"""
+Compiled Resource Cache
+
+Parsing the resource files (the API definition and the constraint deferrals)
+is repeated every time the editor starts and every time the API is refreshed.
+Here the parsed structures are saved to an on-disk cache so that, as long as
+nothing has changed, they can be loaded back with a single read.
+
+Each cache entry is keyed by the content hash of every file that went into
+building it, including the module that does the parsing.  So editing either
+a resource file or the parsing code simply causes the entry to be rebuilt.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import pickle
+import hashlib
+
+# Cache entries are written here, relative to the source code directory
+CACHE_DIR = "Cache"
+CACHE_SUFFIX = ".cache"
+
+def file_digest( fname ):
+    """
+    Returns a hash of the content of the named file.
+
+    """
+    with open( fname, 'rb' ) as f:
+        return hashlib.sha1( f.read() ).hexdigest()
+
+def source_key( source_files ):
+    """
+    Returns the key that identifies one particular version of the source files.
+
+    """
+    return tuple( file_digest( f ) for f in source_files )
+
+def cache_path( name ):
+    """
+    Returns the path of the named cache entry.
+
+    """
+    return os.path.join( CACHE_DIR, name + CACHE_SUFFIX )
+
+def load( name, source_files ):
+    """
+    Returns the data saved in the named cache entry, or None if there is no
+    entry or if any of the source files has changed since it was saved.
+
+    """
+    try:
+        with open( cache_path( name ), 'rb' ) as f:
+            key, data = pickle.load( f )
+    except Exception:
+        # Missing, unreadable or from an incompatible version, just rebuild
+        return None
+
+    return data if key == source_key( source_files ) else None
+
+def save( name, source_files, data ):
+    """
+    Saves data in the named cache entry, keyed by the current content of the
+    source files.  Failure to write the cache is never fatal, the data will just
+    be rebuilt next time.
+
+    """
+    path = cache_path( name )
+    temp_path = path + ".{}".format( os.getpid() )
+    try:
+        os.makedirs( CACHE_DIR, exist_ok=True )
+        with open( temp_path, 'wb' ) as f:
+            pickle.dump( ( source_key( source_files ), data ), f, pickle.HIGHEST_PROTOCOL )
+        # Replace any existing entry in one step so that a concurrently
+        # launched editor never sees a partially written file
+        os.replace( temp_path, path )
+    except OSError:
+        try:
+            os.remove( temp_path )
+        except OSError:
+            pass
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+
+"""
+Command File Check
+
+Finds every syntax, type and value error in a set of command files before
+any of them is run.  Normally a bad line is only found when the run reaches
+it, possibly after minutes of database work that must then be undone or
+resumed.
+
+Each line is lexed and translated into its API call, exactly as when it is
+run, but nothing is sent to the database.  UI commands are parsed and, for
+focus, run, so that the lines after a focus command are translated with its
+defaults.  Other UI commands, such as read, are only parsed.  Names of
+model elements can only be checked against the database, so they are not.
+
+Files are checked independently, so large inputs are spread over a pool of
+processes.  The focus each file starts with is found first by a quick pass
+that runs only the focus commands of the files before it.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import io
+import os
+import copy
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Local
+from mi_Error import *
+from mi_Stats import Latency_Stats
+
+# Inputs of more than one file with at least this many bytes are checked
+# by a process pool, smaller ones aren't worth starting the processes for
+PARALLEL_SIZE = 1000000
+
+# The session copy that translates lines, inherited by pool processes
+checker = None
+
+def new_checker( session ):
+    """
+    Returns a copy of the session that can translate lines without changing
+    the session's focus or timing stats.
+
+    """
+    c = copy.copy( session )
+    c.api = copy.deepcopy( session.api )
+    c.stats = Latency_Stats()
+    return c
+
+def set_focus( api, defaults ):
+    """
+    Replaces the focus defaults of the API with a list of ( subject, value ).
+
+    """
+    api.clear_default()
+    for s, v in defaults:
+        api.commands[s]['default'] = v
+
+def read_lines( cmd_fname ):
+    """
+    Returns the lines of a command file, or None if it can't be read.
+
+    """
+    try:
+        with open( cmd_fname ) as f:
+            return list( f )
+    except IOError:
+        return None
+
+def ui_op_of( session, line ):
+    """
+    Returns the UI command of a line, or None for an App command.
+
+    """
+    word = line.split( None, 1 )[0]
+    return session.ui_alias.get( word )
+
+def start_focus( session, cmd_files, carried ):
+    """
+    Returns the focus defaults each file starts out with, running only the
+    focus commands of the files before it if the focus is carried from one
+    file to the next.
+
+    """
+    c = new_checker( session )
+    starts = []
+    for cmd_fname in cmd_files:
+        starts.append( c.api.get_all_defaults() )
+        lines = read_lines( cmd_fname ) if carried else None
+        if not lines:
+            continue
+        with contextlib.redirect_stdout( io.StringIO() ):
+            for n, line in c.numbered_commands( lines ):
+                if ui_op_of( c, line ) == 'focus':
+                    try:
+                        c.translate( line )
+                    except Exception:
+                        pass # Reported when the file is checked
+    return starts
+
+def check_lines( c, lines ):
+    """
+    Translates each command of a script and returns the number of commands
+    and the ( line number, line, error message ) of each that failed.
+
+    """
+    errors = []
+    count = 0
+    for n, line in c.numbered_commands( lines ):
+        count += 1
+        out = io.StringIO() # Errors print their message as they are raised
+        try:
+            with contextlib.redirect_stdout( out ):
+                ui_op = ui_op_of( c, line )
+                if ui_op == 'focus':
+                    c.translate( line )
+                elif ui_op:
+                    term = line.split( None, 1 )
+                    c.parse_ui_args( ui_op, term[1] if len( term ) > 1 else "" )
+                else:
+                    c.translate( line )
+        except mi_Error:
+            errors.append( ( n, line, out.getvalue().strip() or "Bad command" ) )
+        except Exception as e:
+            errors.append( ( n, line, "{}: {}".format( type( e ).__name__, e ) ) )
+    return count, errors
+
+def check_file( job ):
+    """
+    Checks one command file, starting from the given focus defaults.
+    Returns the number of commands and the errors, see check_lines(), or
+    None if the file can't be read.
+
+    """
+    cmd_fname, defaults = job
+    lines = read_lines( cmd_fname )
+    if lines is None:
+        return None
+    set_focus( checker.api, defaults )
+    return check_lines( checker, lines )
+
+def check_files( session, cmd_files, carried=True ):
+    """
+    Checks every command file and returns, for each, its number of commands
+    and errors, or None if it can't be read.
+
+    """
+    global checker
+    checker = new_checker( session )
+    jobs = list( zip( cmd_files, start_focus( session, cmd_files, carried ) ) )
+    size = sum( os.path.getsize( f ) for f in cmd_files if os.path.isfile( f ) )
+    workers = min( len( cmd_files ), os.cpu_count() or 1 )
+    if workers > 1 and size >= PARALLEL_SIZE:
+        try:
+            # Forked processes inherit the checker, nothing else needs to be sent
+            context = multiprocessing.get_context( 'fork' )
+        except ValueError:
+            context = None
+        if context:
+            with ProcessPoolExecutor( workers, mp_context=context ) as pool:
+                return list( pool.map( check_file, jobs ) )
+    return [ check_file( j ) for j in jobs ]
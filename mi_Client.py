@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+
+"""
+Editor Daemon Client
+
+Forwards command files, or the commands piped in, to an editor daemon (see
+mi_Daemon) over a local Unix domain socket and prints the output streamed
+back.  The daemon has the API parsed and its database connections open, so
+a scripted run costs a socket round trip rather than a fresh editor
+startup.  This module imports nothing else from the editor for that reason.
+
+Each file is sent as a request: a header line naming it, then its content.
+The daemon runs it as a command file and streams back the output, followed
+by STATUS_MARK and '0' if every command succeeded or '1' if not.
+
+The socket is kept where other users can't put one of their own in its
+place: the user's runtime directory or, failing that, a directory in the
+temp directory that only the user can access.  A socket that doesn't
+belong to the user is never listened at or sent to.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import sys
+import socket
+import tempfile
+
+# Made by the daemon for its socket when there is no runtime directory
+PRIVATE_DIR = os.path.join( tempfile.gettempdir(), "miuml-{}".format( os.getuid() ) )
+SOCKET_NAME = "miuml.sock"
+
+# The daemon listens here unless told otherwise, one socket per user
+DEFAULT_SOCKET = os.environ.get( "MIUML_SOCKET",
+        os.path.join( os.environ.get( "XDG_RUNTIME_DIR" ) or PRIVATE_DIR, SOCKET_NAME ) )
+
+# Ends the output of a request, followed by the status character
+STATUS_MARK = b'\0'
+SUCCEEDED, FAILED = b'0', b'1'
+
+# Name of the piped input in a request header
+PIPED = "<input pipe>"
+
+READ_SIZE = 65536
+
+def owned( path ):
+    """
+    Returns True if the path, not following a link, belongs to this user.
+
+    """
+    return os.lstat( path ).st_uid == os.getuid()
+
+def send( socket_path, name, content ):
+    """
+    Sends one request and copies the output to stdout as it arrives.
+    Returns True if every command succeeded.
+
+    """
+    if os.stat( socket_path ).st_uid != os.getuid():
+        raise PermissionError( "{} belongs to another user".format( socket_path ) )
+    s = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    s.connect( socket_path )
+    with s:
+        s.sendall( ( name + "\n" ).encode() + content )
+        s.shutdown( socket.SHUT_WR )
+        out = sys.stdout.buffer
+        while True:
+            data = s.recv( READ_SIZE )
+            if not data:
+                return False # The daemon went away before finishing
+            end = data.find( STATUS_MARK )
+            if end >= 0:
+                break
+            out.write( data )
+            out.flush()
+        out.write( data[:end] )
+        out.flush()
+        status = data[end + 1:end + 2]
+        while not status:
+            # The status character arrived after the mark
+            data = s.recv( 1 )
+            if not data:
+                return False
+            status = data
+    return status == SUCCEEDED
+
+def main( args, launch_dir ):
+    """
+    Runs the client: miuml.py -client [-socket <path>] [command_file ...]
+    Without command files, the commands are read from stdin.  Returns the
+    exit status, stopping at the first file that fails.
+
+    """
+    socket_path = DEFAULT_SOCKET
+    if '-socket' in args:
+        i = args.index( '-socket' )
+        if i + 1 >= len( args ):
+            print( "Option -socket requires a valid value." )
+            return 2
+        # Relative to where the editor was launched, as for the daemon
+        socket_path = os.path.abspath( os.path.join( launch_dir, args[i + 1] ) )
+        del args[i:i + 2]
+    cmd_files = [ os.path.abspath( os.path.join( launch_dir, f ) ) for f in args if not f.startswith('-') ]
+
+    try:
+        if not cmd_files:
+            return 0 if send( socket_path, PIPED, sys.stdin.buffer.read() ) else 1
+        for cmd_fname in cmd_files:
+            try:
+                with open( cmd_fname, 'rb' ) as f:
+                    content = f.read()
+            except IOError:
+                print( "Could not open {}".format( cmd_fname ) )
+                return 1
+            if not send( socket_path, cmd_fname, content ):
+                return 1
+    except ( FileNotFoundError, ConnectionRefusedError ):
+        print( "No miUML daemon at {}, start one with: miuml.py -daemon".format( socket_path ) )
+        return 2
+    except PermissionError as e:
+        print( "Not sending to a daemon of another user: {}".format( e ) )
+        return 2
+    return 0
@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+
+"""
+Command Line Completion
+
+Completes the command being typed at the interactive prompt when tab is
+pressed: UI commands and ops, the subjects of an op, the args of a command
+and the value of an arg that names a domain, subsystem or class, as in:
+
+    new attr -name Altitude -c Air Tr<tab>
+
+Everything is looked up in prefix tries built ahead of time, so completion
+takes no longer with tens of thousands of model elements than with a few.
+Model names are taken from the model mirror, see mi_Mirror.  Without -mirror
+the names are read the first time they are needed, and again after a command
+changes the model.
+
+Since a model name may contain spaces, readline is told not to split the line
+into words.  The completer is always given the whole line up to the cursor
+and returns whole lines.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import re
+
+# Local
+from mi_Error import *
+from mi_Mirror import Model_Mirror, MIRRORED
+
+# Most completions offered at once, readline lists them all
+MAX_MATCHES = 200
+
+# Key of the word ending at a trie node, no character can be empty
+END = ''
+
+# Splits a command line into its op, subject and the rest
+LINE = re.compile( r'\s*(?P<op>\S+)(?:\s+(?P<subject>\S*)(?P<rest>\s.*)?)?$', re.DOTALL )
+
+class Trie:
+    """
+    Prefix Trie
+
+    Each node is a dictionary of next character : node, plus the word
+    ending at that node, if any, under END.
+
+    """
+    def __init__( self, words=() ):
+        self.root = {}
+        for w in words:
+            self.add( w )
+
+    def add( self, word ):
+        node = self.root
+        for ch in word:
+            node = node.setdefault( ch, {} )
+        node[END] = word
+
+    def complete( self, prefix, limit=MAX_MATCHES ):
+        """
+        Returns up to limit words starting with the prefix, in order.
+
+        """
+        node = self.root
+        for ch in prefix:
+            node = node.get( ch )
+            if node is None:
+                return []
+        words = []
+        pending = [ node ] # Depth first, in character order
+        while pending and len( words ) < limit:
+            node = pending.pop()
+            if END in node:
+                words.append( node[END] )
+            pending.extend( node[ch] for ch in sorted( node, reverse=True ) if ch != END )
+        return words
+
+class Completer:
+    """
+    Readline Completer
+
+    """
+    def __init__( self, session ):
+        self.session = session
+        self.matches = []
+        self.built_for = None # The API the tries below were built from, see build()
+
+        # Model names, see names()
+        self.mirror = None # Read here, if there is no mirror in use
+        self.stale = False # True once the model has changed since the names were read
+        self.version = None # Of the mirror the name tries were built from
+        self.name_tries = {} # ( scope, domain or None for all ) : Trie
+
+    def complete( self, text, state ):
+        """
+        Readline completion function, returns the state'th completion of the
+        line up to the cursor, or None after the last one.
+
+        """
+        if state == 0:
+            try:
+                self.matches = self.complete_line( text )
+            except Exception:
+                self.matches = [] # Never let a completion bug break the prompt
+        return self.matches[state] if state < len( self.matches ) else None
+
+    def build( self ):
+        """
+        Builds the tries of the API from the session's, again once refresh
+        has replaced it.
+
+        """
+        api = self.session.api
+        if api is self.built_for:
+            return
+        # First word: UI commands, API ops and the exit commands
+        self.first = Trie( list( self.session.ui_alias ) + list( api.ops ) + self.session.exit_commands )
+
+        # op : Trie of the subject names and aliases taking that op
+        self.subjects = {}
+        for name, op in api.index:
+            self.subjects.setdefault( op, Trie() ).add( name )
+        self.all_subjects = Trie( api.alias )
+
+        # ( subject, op ) or UI command : Trie of its args, built as needed
+        self.args = {}
+        self.built_for = api
+
+    def complete_line( self, line ):
+        """
+        Returns every completion of a partial command line.
+
+        """
+        self.build()
+        r = LINE.match( line )
+        if not r:
+            return []
+        if r.group('subject') is None:
+            if line.endswith( ( ' ', '\t' ) ):
+                return [] # Nothing after the op yet
+            return self.extend( line, r.group('op'), self.first.complete( r.group('op') ) )
+
+        op = r.group('op')
+        if op in self.session.ui_alias:
+            ui_op = self.session.ui_alias[op]
+            return self.complete_args( line, line[r.start('subject') - 1:], ui_op,
+                self.session.ui_cmd[ui_op]['syntax'], self.ui_value )
+
+        if r.group('rest') is None:
+            subject = r.group('subject')
+            return self.extend( line, subject, self.subjects.get( op, Trie() ).complete( subject ) )
+
+        entry = self.session.api.index.get( ( r.group('subject'), op ) )
+        if not entry:
+            return []
+        subject, plan = entry
+        arg_specs = self.session.api.commands[subject]['ops'][op]['args']
+        return self.complete_args( line, r.group('rest'), ( subject, op ), arg_specs,
+            lambda a, done: self.app_value( arg_specs.get( a, {} ), done ) )
+
+    def complete_args( self, line, rest, key, arg_specs, values ):
+        """
+        Completes the last arg name, or the value of the last arg, using the
+        values function to get a trie of possible values from the arg name
+        and the arg text already complete.
+
+        """
+        if key not in self.args:
+            self.args[key] = Trie( arg_specs )
+        i = rest.rfind( ' -' )
+        if i < 0:
+            # Nothing typed after the command yet, offer its args
+            return [ line + '-' + a for a in self.args[key].complete( "" ) ] if not rest.strip() else []
+        arg, space, value = rest[i + 2:].partition( ' ' )
+        if not space:
+            return self.extend( line, arg, self.args[key].complete( arg ) )
+        value = value.lstrip()
+        trie = values( arg, rest[:i] )
+        if not trie:
+            return []
+        # A list value, ex: -subclasses A, B, completes its last element
+        element = value.rpartition( ',' )[2].lstrip()
+        return self.extend( line, element, trie.complete( element ) )
+
+    def app_value( self, arg_spec, done ):
+        """
+        Returns a trie of the names an app arg can take, if it names
+        something in the model.
+
+        """
+        scope = arg_spec.get('scope')
+        if scope not in MIRRORED:
+            return None
+        domain = None
+        if scope != 'domain':
+            # Names are only unique within a domain, the one given
+            # earlier on the line or focused on, if any
+            r = re.search( r'(?:^|\s)-(?:d|domain)\s+(.*?)(?:\s+-|$)', done )
+            domain = r.group(1).strip() if r else self.session.api.commands['domain'].get('default')
+        return self.names( scope, domain )
+
+    def ui_value( self, arg, done ):
+        """
+        Returns a trie of the values a UI command arg can take: subjects
+        for -s or -c, or the names of the subject given by -s for -v.
+
+        """
+        if arg in ( 's', 'c' ):
+            return self.all_subjects
+        r = re.search( r'(?:^|\s)-s\s+(\S+)', done )
+        if arg == 'v' and r and self.session.api.alias.get( r.group(1) ) in MIRRORED:
+            scope = self.session.api.alias[r.group(1)]
+            return self.names( scope,
+                None if scope == 'domain' else self.session.api.commands['domain'].get('default') )
+        return None
+
+    def names( self, scope, domain=None ):
+        """
+        Returns a trie of the domain names, or the subsystem or class names
+        in a domain, or in every domain if it is None or unknown.
+
+        """
+        mirror = self.session.mirror
+        if not mirror:
+            if not self.mirror or self.stale:
+                loaded = Model_Mirror( self.session.api )
+                try:
+                    loaded.load( self.session.editor )
+                except mi_Error:
+                    return None # Tried again next time
+                self.mirror = loaded
+                self.version = None # Its count starts over
+                self.stale = False
+            mirror = self.mirror
+        if mirror.version != self.version:
+            self.name_tries = {}
+            self.version = mirror.version
+
+        domains = mirror.domains
+        key = ( scope, domain if domain in domains else None )
+        if key not in self.name_tries:
+            if scope == 'domain':
+                words = domains
+            elif key[1]:
+                words = domains[domain][scope]
+            else:
+                words = { n for d in domains.values() for n in d[scope] }
+            self.name_tries[key] = Trie( words )
+        return self.name_tries[key]
+
+    def changed( self ):
+        """
+        Notes that a command has changed the model.
+
+        """
+        self.stale = True
+
+    @staticmethod
+    def extend( line, partial, words ):
+        """
+        Returns the line with the partial word replaced by each completion.
+
+        """
+        head = line[:len( line ) - len( partial )]
+        return [ head + w for w in words ]
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+
+"""
+Editor Daemon
+
+Starting the editor means starting Python, parsing the API definition,
+loading the deferrals and connecting to the database, which together take
+far longer than the few commands a script usually sends.  Started with
+-daemon, the editor does all that once and then runs the command files sent
+by clients (see mi_Client) over a local Unix domain socket, keeping at
+least one database connection open between them, however long it is idle.
+
+Requests are run one at a time, in the order they arrive, each as a command
+file processed with the daemon's options, ex: -tx or -bulk.  Each starts out
+with the focus the daemon started with, so requests don't depend on the
+ones before them.  Output is streamed back to the client as it is written.
+
+The socket is only accessible by the user running the daemon.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import io
+import os
+import sys
+import socket
+import signal
+
+# Local
+from mi_Client import STATUS_MARK, SUCCEEDED, FAILED, PRIVATE_DIR, owned
+from mi_Check import set_focus
+
+# Connections waiting to be accepted while a request runs
+BACKLOG = 16
+
+def listen( socket_path ):
+    """
+    Returns a socket listening at the path, or None if another daemon is
+    already listening there.  A socket left by a daemon that has gone is
+    replaced.  Raises PermissionError if the socket, or the private
+    directory made for it, belongs to another user.
+
+    """
+    directory = os.path.dirname( socket_path )
+    if directory == PRIVATE_DIR:
+        os.makedirs( directory, 0o700, exist_ok=True )
+        if not owned( directory ) or os.lstat( directory ).st_mode & 0o077:
+            raise PermissionError( "{} is not private to this user".format( directory ) )
+    if os.path.lexists( socket_path ):
+        if not owned( socket_path ):
+            raise PermissionError( "{} belongs to another user".format( socket_path ) )
+        probe = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            probe.connect( socket_path )
+            return None
+        except OSError:
+            os.remove( socket_path )
+        finally:
+            probe.close()
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    umask = os.umask( 0o077 ) # Only this user may connect
+    try:
+        server.bind( socket_path )
+    finally:
+        os.umask( umask )
+    server.listen( BACKLOG )
+    return server
+
+def stop( signum, frame ):
+    raise KeyboardInterrupt
+
+def serve( session, socket_path ):
+    """
+    Runs the requests of clients until interrupted or terminated.
+
+    """
+    try:
+        server = listen( socket_path )
+    except OSError as e:
+        print( "Can't listen at {}: {}".format( socket_path, e ) )
+        return False
+    if not server:
+        print( "A miUML daemon is already running at {}".format( socket_path ) )
+        return False
+    signal.signal( signal.SIGTERM, stop )
+    if session.pool:
+        # Connect now, so the first request doesn't wait for it
+        session.pool.putconn( session.pool.getconn() )
+    print( "miUML daemon listening at {}".format( socket_path ) )
+    sys.stdout.flush()
+    focus = session.api.get_all_defaults()
+    try:
+        while True:
+            conn, address = server.accept()
+            with conn:
+                set_focus( session.api, focus )
+                run_request( session, conn )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove( socket_path )
+    return True
+
+def run_request( session, conn ):
+    """
+    Reads a request, a header line naming the source and the commands, runs
+    the commands as a command file and sends back the output and status.
+    A request that can't be decoded or run fails on its own, the daemon
+    carries on with the next.
+
+    """
+    request = conn.makefile( 'rb' )
+    out = conn.makefile( 'w', encoding='utf-8' )
+    stdout = sys.stdout
+    sys.stdout = out
+    succeeded = False
+    try:
+        try:
+            name = request.readline().decode().rstrip( "\n" ) or "<client>"
+            commands = io.StringIO( request.read().decode() )
+        except UnicodeDecodeError as e:
+            print( "Request is not valid UTF-8 ({}), nothing was run".format( e.reason ) )
+        else:
+            try:
+                session.mode = "batch"
+                succeeded, cmd_count, elapsed = session.process_file( name, commands,
+                        session.options.get('transaction', False) )
+                if session.quiet:
+                    session.summary( cmd_count, elapsed, name, succeeded )
+            except OSError:
+                raise
+            except Exception as e:
+                print( "Request failed: {}: {}".format( type( e ).__name__, e ) )
+                if session.editor.in_batch:
+                    session.editor.end_batch( commit=False )
+                succeeded = False
+        out.flush()
+        conn.sendall( STATUS_MARK + ( SUCCEEDED if succeeded else FAILED ) )
+    except OSError:
+        pass # The client went away, the commands it sent have still been run
+    finally:
+        sys.stdout = stdout
@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+
+"""
+Command File Journal
+
+Records how far a command file got the last time it was applied to a
+database, so that a long file that failed part way through can be fixed and
+run again without starting over, which would just fail at once on the
+elements the first run created.
+
+The journal of a file holds the line number and a hash of each command
+known to be applied, in order.  When the file is run again with -resume,
+its commands are compared with the journal one by one, and each one that
+matches is skipped.  The first command that isn't in the journal, or that
+has changed, and everything after it, is run.  Focus commands in the
+skipped part are still run, since the commands after them depend on them.
+
+A journal belongs to one file applied to one database, it is kept in the
+Journal directory under a name made from both.  When a run starts, the
+journal is cut back to the commands found applied, then each command is
+added as soon as it is applied, or for -bulk, as its chunk is.  A run that
+is killed or interrupted part way thus loses nothing.  Under -tx, nothing
+is added until the file's transaction commits.  With the memory backend,
+whose model lasts only as long as the editor, the journal is only kept in
+memory.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import hashlib
+
+# Journals are written here, relative to the source code directory
+JOURNAL_DIR = "Journal"
+JOURNAL_SUFFIX = ".journal"
+
+def command_hash( line ):
+    """
+    Returns the hash recorded for a command.
+
+    """
+    return hashlib.sha1( line.encode() ).hexdigest()
+
+class Command_Journal:
+    """
+    Command File Journal
+
+    """
+    def __init__( self, cmd_fname, target ):
+        """
+        Opens the journal of a command file applied to the target database.
+        With no target, the journal is only kept in memory.
+
+        """
+        self.path = None
+        if target is not None:
+            name = hashlib.sha1( "{}\n{}".format( os.path.abspath( cmd_fname ), target ).encode() )
+            self.path = os.path.join( JOURNAL_DIR, name.hexdigest() + JOURNAL_SUFFIX )
+        self.entries = self.read() # [ ( line number, command hash ) ]
+        self.commands = [] # Of the run in progress, see begin()
+        self.position = 0 # Of the next command to be applied
+        self.deferred = False
+        self.pending = [] # Entries waiting for commit()
+        self.file = None
+
+    def read( self ):
+        if not self.path:
+            return []
+        try:
+            with open( self.path ) as f:
+                return [ ( int( n ), h ) for n, h in ( line.split() for line in f ) ]
+        except ( OSError, ValueError ):
+            # No journal, or a damaged one, so nothing is known to be applied
+            return []
+
+    def applied( self, commands ):
+        """
+        Returns the number of commands, a list of ( line number, line ), at
+        the start of a file that the journal shows were already applied.
+
+        """
+        count = 0
+        for ( n, line ), ( jn, h ) in zip( commands, self.entries ):
+            if command_hash( line ) != h:
+                break
+            count += 1
+        return count
+
+    def record( self, commands ):
+        """
+        Replaces the journal with the commands, a list of ( line number,
+        line ), known to be applied.  Failure to write the journal is never
+        fatal, the next run will just start further back.
+
+        """
+        self.entries = [ ( n, command_hash( line ) ) for n, line in commands ]
+        if not self.path:
+            return
+        temp_path = self.path + ".{}".format( os.getpid() )
+        try:
+            os.makedirs( JOURNAL_DIR, exist_ok=True )
+            with open( temp_path, 'w' ) as f:
+                f.writelines( "{} {}\n".format( n, h ) for n, h in self.entries )
+            os.replace( temp_path, self.path )
+        except OSError:
+            try:
+                os.remove( temp_path )
+            except OSError:
+                pass
+
+    def begin( self, commands, skipped, deferred=False ):
+        """
+        Starts a run of a file's commands, a list of ( line number, line ),
+        the first skipped of which were found applied.  The journal is cut
+        back to those and the rest are added by advance() as they are
+        applied.  If deferred, as under -tx, they are held until commit().
+
+        """
+        self.record( commands[:skipped] )
+        self.commands = commands
+        self.position = skipped
+        self.deferred = deferred
+        self.pending = []
+        if self.path:
+            try:
+                self.file = open( self.path, 'a' )
+            except OSError:
+                self.file = None
+
+    def advance( self, count ):
+        """
+        Adds the next count commands of the run, now applied.
+
+        """
+        added = [ ( n, command_hash( line ) )
+                for n, line in self.commands[self.position:self.position + count] ]
+        self.position += count
+        if self.deferred:
+            self.pending.extend( added )
+        else:
+            self.write( added )
+
+    def commit( self ):
+        """
+        Adds the commands held since begin(), once their transaction commits.
+
+        """
+        self.write( self.pending )
+        self.pending = []
+
+    def write( self, entries ):
+        """
+        Appends entries, flushed at once so they outlast the editor.
+
+        """
+        self.entries.extend( entries )
+        if not ( self.file and entries ):
+            return
+        try:
+            self.file.writelines( "{} {}\n".format( n, h ) for n, h in entries )
+            self.file.flush()
+        except OSError:
+            self.close()
+
+    def close( self ):
+        """
+        Ends the run, dropping anything not committed.
+
+        """
+        self.pending = []
+        if self.file:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
@@ -0,0 +1,611 @@
+#! /usr/bin/env python
+
+"""
+In Memory Database Session
+
+A stand-in for the miUML PostgreSQL database, selected with -backend memory.
+It understands the UI_ calls defined in api_def.mi well enough to keep the
+domains, subsystems, classes, attributes, relationships and bridges of a
+model in memory, and to return realistic rows for the show commands.
+
+It checks the basic rules the metamodel enforces (unique names and aliases,
+class and relationship numbers within subsystem ranges, references to
+existing model elements), but it is not the metamodel.  It is meant for
+offline runs and for profiling the editor without a database.
+
+A mem_Session has the same interface as db_Session.  Each command and each
+batch transaction is applied as a unit: every change to the model is
+journaled so that a failed command, or an aborted batch, is undone.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import re
+import sys
+import time
+import threading
+
+# Local
+_MODULE_DIR = os.path.abspath("../Modules")
+if _MODULE_DIR not in sys.path:
+    sys.path.append(_MODULE_DIR)
+from mi_Error import *
+from mi_RDB import sql_literal
+
+# Error codes reported the same way the database reports them
+RAISED = 'P0001' # Rule violated, raised by a UI function
+UNDEFINED_FUNCTION = '42883'
+INTERNAL_ERROR = 'XX000'
+
+# Initial domain build spec
+BUILD_SPEC = {
+    'domain_name_is_default_subsys_name':False,
+    'default_subsys_name':'Main',
+    'default_subsys_range':100,
+    'default_id_name':'ID',
+    'default_id_type':'nominal'
+}
+
+# Call param, used to recover arg values when a call's shape isn't supplied
+CALL_PARAM = re.compile( r'p_(?P<name>\w+):=(?P<value>array\[[^\]]*\]|%s)' )
+
+MISSING = object() # Journal entry for a key that was added
+
+def call_args( cmd, pvals, shape=None ):
+    """
+    Returns the api name and a dictionary of param name : value for a call.
+    A list param has a list value.
+
+    """
+    api_name = cmd.split('(')[0]
+    if shape:
+        params = shape[1]
+    else:
+        params = [ ( r.group('name'),
+                r.group('value').count("%s") if r.group('value') != "%s" else None )
+            for r in CALL_PARAM.finditer( cmd ) ]
+    p = {}
+    i = 0
+    for pname, length in params:
+        if length is None:
+            p[pname] = pvals[i]
+            i += 1
+        else:
+            p[pname] = list( pvals[i:i + length] )
+            i += length
+    return api_name, p
+
+def fail( message ):
+    """
+    Rejects a call as the database would.
+
+    """
+    raise mi_DB_Error( RAISED, message )
+
+class mem_Model:
+    """
+    In Memory Model
+
+    The model data shared by every mem_Session, as a database is shared by
+    every connection.  One call is applied at a time.
+
+    Each api call is applied by the method of the same name prefixed with api_.
+    Each domain holds its own subsystems, classes and relationships keyed by
+    name or number.  All changes are made through put() and remove(), which
+    record the replaced value in the journal of the session making the call.
+
+    """
+    def __init__( self ):
+        self.domains = {} # name : domain
+        self.bridges = {} # ( client, service ) : bridge
+        self.spec = dict( BUILD_SPEC )
+        self.lock = threading.RLock()
+        self.journal = None # of the session whose call is being applied
+
+    # <<< Journaled changes >>>
+
+    def put( self, container, key, value ):
+        self.journal.append( ( container, key, container.get( key, MISSING ) ) )
+        container[key] = value
+
+    def remove( self, container, key ):
+        self.journal.append( ( container, key, container[key] ) )
+        del container[key]
+
+    def undo( self, journal, mark=0 ):
+        """
+        Restores everything changed since the journal was at the mark.
+
+        """
+        with self.lock:
+            while len( journal ) > mark:
+                container, key, old = journal.pop()
+                if old is MISSING:
+                    del container[key]
+                else:
+                    container[key] = old
+
+    def call( self, api_name, p, journal ):
+        """
+        Applies an api call to the model, returning any rows.
+
+        """
+        # UI_new_domain is applied by api_new_domain, and so on
+        op = getattr( self, 'api_' + api_name.split( '_', 1 )[-1], None )
+        if not op:
+            raise mi_DB_Error( UNDEFINED_FUNCTION, "function {} does not exist".format( api_name ) )
+        with self.lock:
+            self.journal = journal
+            try:
+                return op( p )
+            except mi_DB_Error:
+                raise
+            except Exception as e:
+                # Missing or unexpected param values
+                raise mi_DB_Error( INTERNAL_ERROR, "{} failed: {}".format( api_name, e ) )
+            finally:
+                self.journal = None
+
+    # <<< Lookup >>>
+
+    def domain( self, name ):
+        if name not in self.domains:
+            fail( "Domain [{}] does not exist.".format( name ) )
+        return self.domains[name]
+
+    def subsystem( self, domain, name ):
+        if name not in domain['subsystems']:
+            fail( "Subsystem [{}] does not exist in domain [{}].".format( name, domain['name'] ) )
+        return domain['subsystems'][name]
+
+    def mclass( self, domain, name ):
+        if name not in domain['classes']:
+            fail( "Class [{}] does not exist in domain [{}].".format( name, domain['name'] ) )
+        return domain['classes'][name]
+
+    def attribute( self, mclass, name ):
+        if name not in mclass['attrs']:
+            fail( "Attribute [{}] does not exist in class [{}].".format( name, mclass['name'] ) )
+        return mclass['attrs'][name]
+
+    def next_number( self, domain, subsys, number, used, counter ):
+        """
+        Returns the supplied class or relationship number if it is free and in
+        the subsystem's range, otherwise the next free number in that range.
+
+        """
+        if number is not None:
+            if not subsys['floor'] <= number <= subsys['ceiling']:
+                fail( "Number [{}] is outside the range of subsystem [{}].".format(
+                    number, subsys['name'] ) )
+            if number in used:
+                fail( "Number [{}] is already used in domain [{}].".format( number, domain['name'] ) )
+            return number
+        number = subsys[counter]
+        while number in used:
+            number += 1
+        if number > subsys['ceiling']:
+            fail( "Subsystem [{}] has no numbers left.".format( subsys['name'] ) )
+        self.put( subsys, counter, number + 1 )
+        return number
+
+    def check_alias( self, container, alias, kind ):
+        if any( e['alias'] == alias for e in container.values() ):
+            fail( "{} alias [{}] is already used.".format( kind, alias ) )
+
+    # <<< Domains >>>
+
+    def api_new_domain( self, p ):
+        name, alias = p['name'], p['alias']
+        if name in self.domains:
+            fail( "Domain [{}] already exists.".format( name ) )
+        self.check_alias( self.domains, alias, "Domain" )
+        domain = { 'name':name, 'alias':alias, 'dtype':p.get('type') or 'modeled',
+                'subsystems':{}, 'classes':{}, 'rels':{}, 'next_element':1,
+                'class_aliases':{}, 'cnums':{} } # Class indexes, alias or cnum : name
+        self.put( self.domains, name, domain )
+        if domain['dtype'] == 'modeled':
+            # A modeled domain starts out with one subsystem
+            subsys_name = name if self.spec['domain_name_is_default_subsys_name'] \
+                else self.spec['default_subsys_name']
+            self.put( domain['subsystems'], subsys_name, { 'name':subsys_name, 'alias':subsys_name,
+                'floor':1, 'ceiling':self.spec['default_subsys_range'],
+                'next_cnum':1, 'next_rnum':1 } )
+        return []
+
+    def api_delete_domain( self, p ):
+        self.domain( p['name'] )
+        for b in list( self.bridges ):
+            if p['name'] in b:
+                self.remove( self.bridges, b )
+        self.remove( self.domains, p['name'] )
+        return []
+
+    def api_set_domain( self, p ):
+        domain = self.domain( p['name'] )
+        if p.get('new_alias') is not None and p['new_alias'] != domain['alias']:
+            self.check_alias( self.domains, p['new_alias'], "Domain" )
+            self.put( domain, 'alias', p['new_alias'] )
+        new_name = p.get('new_name')
+        if new_name is not None and new_name != domain['name']:
+            if new_name in self.domains:
+                fail( "Domain [{}] already exists.".format( new_name ) )
+            self.remove( self.domains, domain['name'] )
+            for client, service in list( self.bridges ):
+                if domain['name'] in ( client, service ):
+                    bridge = self.bridges[( client, service )]
+                    self.remove( self.bridges, ( client, service ) )
+                    client = new_name if client == domain['name'] else client
+                    service = new_name if service == domain['name'] else service
+                    self.put( self.bridges, ( client, service ),
+                        dict( bridge, client=client, service=service ) )
+            self.put( domain, 'name', new_name )
+            self.put( self.domains, new_name, domain )
+        return []
+
+    def api_get_domains( self, p ):
+        return [ ( d['name'], d['alias'], d['dtype'] ) for d in self.domains.values() ]
+
+    def api_get_domain_build_spec( self, p ):
+        return [ tuple( self.spec[k] for k in (
+            'domain_name_is_default_subsys_name', 'default_subsys_name',
+            'default_subsys_range', 'default_id_name', 'default_id_type' ) ) ]
+
+    def api_set_domain_build_spec( self, p ):
+        for k in BUILD_SPEC:
+            if p.get(k) is not None:
+                self.put( self.spec, k, p[k] )
+        return []
+
+    # <<< Subsystems >>>
+
+    def api_new_subsystem( self, p ):
+        domain = self.domain( p['domain'] )
+        name, floor, ceiling = p['name'], p['floor'], p['ceiling']
+        if name in domain['subsystems']:
+            fail( "Subsystem [{}] already exists in domain [{}].".format( name, domain['name'] ) )
+        self.check_alias( domain['subsystems'], p['alias'], "Subsystem" )
+        if floor > ceiling:
+            fail( "Subsystem floor [{}] is above its ceiling [{}].".format( floor, ceiling ) )
+        for s in domain['subsystems'].values():
+            if floor <= s['ceiling'] and s['floor'] <= ceiling:
+                fail( "Subsystem range overlaps subsystem [{}].".format( s['name'] ) )
+        self.put( domain['subsystems'], name, { 'name':name, 'alias':p['alias'],
+            'floor':floor, 'ceiling':ceiling, 'next_cnum':floor, 'next_rnum':floor } )
+        return []
+
+    def api_delete_subsystem( self, p ):
+        domain = self.domain( p['domain'] )
+        self.subsystem( domain, p['name'] )
+        if any( c['subsys'] == p['name'] for c in domain['classes'].values() ):
+            fail( "Subsystem [{}] still has classes.".format( p['name'] ) )
+        if len( domain['subsystems'] ) == 1:
+            fail( "A modeled domain must have at least one subsystem." )
+        self.remove( domain['subsystems'], p['name'] )
+        return []
+
+    def api_set_subsystem( self, p ):
+        domain = self.domain( p['domain'] )
+        subsys = self.subsystem( domain, p['name'] )
+        if p.get('new_alias') is not None and p['new_alias'] != subsys['alias']:
+            self.check_alias( domain['subsystems'], p['new_alias'], "Subsystem" )
+            self.put( subsys, 'alias', p['new_alias'] )
+        new_name = p.get('new_name')
+        if new_name is not None and new_name != subsys['name']:
+            if new_name in domain['subsystems']:
+                fail( "Subsystem [{}] already exists in domain [{}].".format( new_name, domain['name'] ) )
+            for element in list( domain['classes'].values() ) + list( domain['rels'].values() ):
+                if element['subsys'] == subsys['name']:
+                    self.put( element, 'subsys', new_name )
+            self.remove( domain['subsystems'], subsys['name'] )
+            self.put( subsys, 'name', new_name )
+            self.put( domain['subsystems'], new_name, subsys )
+        return []
+
+    def set_next( self, p, counter ):
+        domain = self.domain( p['domain'] )
+        subsys = self.subsystem( domain, p['name'] )
+        if not subsys['floor'] <= p['next_value'] <= subsys['ceiling']:
+            fail( "Number [{}] is outside the range of subsystem [{}].".format(
+                p['next_value'], subsys['name'] ) )
+        self.put( subsys, counter, p['next_value'] )
+        return []
+
+    def api_set_subsystem_next_cnum( self, p ):
+        return self.set_next( p, 'next_cnum' )
+
+    def api_set_subsystem_next_rnum( self, p ):
+        return self.set_next( p, 'next_rnum' )
+
+    def api_get_subsystems( self, p ):
+        domains = [ self.domain( p['domain'] ) ] if p.get('domain') else self.domains.values()
+        return [ ( d['name'], s['name'], s['alias'], s['floor'], s['ceiling'] )
+            for d in domains for s in d['subsystems'].values() ]
+
+    def api_getall_subsystems( self, p ):
+        return [ ( s['name'], s['alias'], s['floor'], s['ceiling'] )
+            for s in self.domain( p['domain'] )['subsystems'].values() ]
+
+    # <<< Classes >>>
+
+    def add_class( self, domain, subsys, name, alias, cnum=None, id_name=None, id_type=None ):
+        """
+        Creates a class with a single attribute identifier.
+
+        """
+        if name in domain['classes']:
+            fail( "Class [{}] already exists in domain [{}].".format( name, domain['name'] ) )
+        if alias in domain['class_aliases']:
+            fail( "Class alias [{}] is already used.".format( alias ) )
+        cnum = self.next_number( domain, subsys, cnum, domain['cnums'], 'next_cnum' )
+        id_name = id_name or self.spec['default_id_name']
+        mclass = { 'name':name, 'alias':alias, 'element':domain['next_element'], 'cnum':cnum,
+            'subsys':subsys['name'], 'attrs':{
+                id_name:{ 'name':id_name, 'type':id_type or self.spec['default_id_type'], 'ids':( 1, ) } } }
+        self.put( domain, 'next_element', domain['next_element'] + 1 )
+        self.put( domain['classes'], name, mclass )
+        self.put( domain['class_aliases'], alias, name )
+        self.put( domain['cnums'], cnum, name )
+        return mclass
+
+    def api_new_class( self, p ):
+        domain = self.domain( p['domain'] )
+        self.add_class( domain, self.subsystem( domain, p['subsys'] ), p['name'], p['alias'],
+            p.get('cnum'), p.get('id_name'), p.get('id_type') )
+        return []
+
+    def api_set_class( self, p ):
+        domain = self.domain( p['domain'] )
+        mclass = self.mclass( domain, p['name'] )
+        if p.get('new_alias') is not None and p['new_alias'] != mclass['alias']:
+            if p['new_alias'] in domain['class_aliases']:
+                fail( "Class alias [{}] is already used.".format( p['new_alias'] ) )
+            self.remove( domain['class_aliases'], mclass['alias'] )
+            self.put( domain['class_aliases'], p['new_alias'], mclass['name'] )
+            self.put( mclass, 'alias', p['new_alias'] )
+        if p.get('new_cnum') is not None and p['new_cnum'] != mclass['cnum']:
+            cnum = self.next_number( domain, domain['subsystems'][mclass['subsys']],
+                p['new_cnum'], domain['cnums'], 'next_cnum' )
+            self.remove( domain['cnums'], mclass['cnum'] )
+            self.put( domain['cnums'], cnum, mclass['name'] )
+            self.put( mclass, 'cnum', cnum )
+        new_name = p.get('new_name')
+        if new_name is not None and new_name != mclass['name']:
+            if new_name in domain['classes']:
+                fail( "Class [{}] already exists in domain [{}].".format( new_name, domain['name'] ) )
+            old_name = mclass['name']
+            for rel in domain['rels'].values():
+                for role in ( 'aclass', 'pclass', 'assoc_class', 'superclass' ):
+                    if rel.get( role ) == old_name:
+                        self.put( rel, role, new_name )
+                if old_name in rel.get( 'subclasses', () ):
+                    self.put( rel, 'subclasses', tuple(
+                        new_name if c == old_name else c for c in rel['subclasses'] ) )
+            self.remove( domain['classes'], old_name )
+            self.put( domain['class_aliases'], mclass['alias'], new_name )
+            self.put( domain['cnums'], mclass['cnum'], new_name )
+            self.put( mclass, 'name', new_name )
+            self.put( domain['classes'], new_name, mclass )
+        return []
+
+    def class_rels( self, domain, name ):
+        return [ r for r in domain['rels'].values() if name in (
+            r.get('aclass'), r.get('pclass'), r.get('assoc_class'), r.get('superclass') )
+            or name in r.get( 'subclasses', () ) ]
+
+    def api_delete_class( self, p ):
+        domain = self.domain( p['domain'] )
+        mclass = self.mclass( domain, p['name'] )
+        rels = self.class_rels( domain, p['name'] )
+        if rels and not p.get('force'):
+            fail( "Class [{}] participates in R{}.".format( p['name'], rels[0]['rnum'] ) )
+        for rel in rels:
+            self.remove( domain['rels'], rel['rnum'] )
+        self.remove( domain['class_aliases'], mclass['alias'] )
+        self.remove( domain['cnums'], mclass['cnum'] )
+        self.remove( domain['classes'], p['name'] )
+        return []
+
+    def api_get_classes( self, p ):
+        domains = [ self.domain( p['domain'] ) ] if p.get('domain') else self.domains.values()
+        rows = []
+        for d in domains:
+            superclasses = { r.get('superclass') for r in d['rels'].values() }
+            for c in sorted( d['classes'].values(), key=lambda c: c['cnum'] ):
+                if p.get('subsystem') and c['subsys'] != p['subsystem']:
+                    continue
+                rows.append( ( c['name'], c['alias'], c['element'], c['cnum'],
+                    c['name'] in superclasses, c['subsys'], d['name'] ) )
+        return rows
+
+    def api_get_id_attrs_for_class( self, p ):
+        mclass = self.mclass( self.domain( p['domain'] ), p['name'] )
+        id_num = p.get('id_num') or 1
+        return [ ( a['name'], id_num ) for a in mclass['attrs'].values() if id_num in a['ids'] ]
+
+    # <<< Attributes >>>
+
+    def api_new_ind_attr( self, p ):
+        mclass = self.mclass( self.domain( p['domain'] ), p['class'] )
+        if p['name'] in mclass['attrs']:
+            fail( "Attribute [{}] already exists in class [{}].".format( p['name'], p['class'] ) )
+        self.put( mclass['attrs'], p['name'], { 'name':p['name'], 'type':p['type'], 'ids':() } )
+        return []
+
+    def api_delete_attr( self, p ):
+        mclass = self.mclass( self.domain( p['domain'] ), p['class'] )
+        attr = self.attribute( mclass, p['name'] )
+        if attr['ids'] and not p.get('force'):
+            fail( "Attribute [{}] is part of identifier {}.".format( p['name'], attr['ids'][0] ) )
+        for id_num in attr['ids']:
+            if not any( id_num in a['ids'] for a in mclass['attrs'].values() if a is not attr ):
+                fail( "Attribute [{}] is the only attribute of identifier {}.".format(
+                    p['name'], id_num ) )
+        self.remove( mclass['attrs'], p['name'] )
+        return []
+
+    def api_add_attr_to_id( self, p ):
+        mclass = self.mclass( self.domain( p['domain'] ), p['class'] )
+        attr = self.attribute( mclass, p['name'] )
+        id_num = p.get('id_num') or 1
+        if id_num not in attr['ids']:
+            self.put( attr, 'ids', attr['ids'] + ( id_num, ) )
+        return []
+
+    # <<< Relationships >>>
+
+    def new_rel( self, domain, subsys, rnum, rel ):
+        rel['rnum'] = self.next_number( domain, subsys, rnum, domain['rels'], 'next_rnum' )
+        rel['subsys'] = subsys['name']
+        self.put( domain['rels'], rel['rnum'], rel )
+
+    def api_new_binary_assoc( self, p ):
+        domain = self.domain( p['domain'] )
+        subsys = self.subsystem( domain, p['subsys'] )
+        self.mclass( domain, p['active_class'] )
+        self.mclass( domain, p['passive_class'] )
+        amult, pmult = p.get('active_mult') or '1', p.get('passive_mult') or '1'
+        rel = { 'kind':'binary', 'aclass':p['active_class'], 'pclass':p['passive_class'],
+            'aphrase':p.get('active_phrase'), 'pphrase':p.get('passive_phrase'),
+            'amult':amult, 'pmult':pmult,
+            'acond':bool( p.get('active_cond') ), 'pcond':bool( p.get('passive_cond') ),
+            # The many side formalizes unless told otherwise
+            'rside':p.get('formalizing_persp') or ( 'A' if amult == 'M' and pmult == '1' else 'P' ) }
+        if p.get('assoc_class'):
+            if not p.get('assoc_alias'):
+                fail( "An association class requires an alias." )
+            self.add_class( domain, subsys, p['assoc_class'], p['assoc_alias'] )
+            rel['assoc_class'] = p['assoc_class']
+        self.new_rel( domain, subsys, p.get('rnum'), rel )
+        return []
+
+    def api_new_gen( self, p ):
+        domain = self.domain( p['domain'] )
+        subsys = self.subsystem( domain, p['subsys'] )
+        subclasses = p['subclasses']
+        aliases = p.get('sub_aliases') or subclasses
+        if len( subclasses ) < 2:
+            fail( "A generalization requires at least two subclasses." )
+        if len( set( subclasses ) ) != len( subclasses ) or p['superclass'] in subclasses:
+            fail( "Each class may appear only once in a generalization." )
+        if len( aliases ) != len( subclasses ):
+            fail( "Each subclass requires one alias." )
+        for name, alias in [ ( p['superclass'], p.get('super_alias') or p['superclass'] ) ] + \
+                list( zip( subclasses, aliases ) ):
+            if name not in domain['classes']:
+                self.add_class( domain, subsys, name, alias )
+        self.new_rel( domain, subsys, p.get('rnum'), { 'kind':'gen',
+            'superclass':p['superclass'], 'subclasses':tuple( subclasses ) } )
+        return []
+
+    # <<< Bridges >>>
+
+    def api_new_bridge( self, p ):
+        self.domain( p['client'] )
+        self.domain( p['service'] )
+        if p['client'] == p['service']:
+            fail( "A domain cannot bridge to itself." )
+        if ( p['client'], p['service'] ) in self.bridges:
+            fail( "Bridge [{}] to [{}] already exists.".format( p['client'], p['service'] ) )
+        self.put( self.bridges, ( p['client'], p['service'] ),
+            { 'client':p['client'], 'service':p['service'] } )
+        return []
+
+    def api_delete_bridge( self, p ):
+        if ( p['client'], p['service'] ) not in self.bridges:
+            fail( "Bridge [{}] to [{}] does not exist.".format( p['client'], p['service'] ) )
+        self.remove( self.bridges, ( p['client'], p['service'] ) )
+        return []
+
+    def api_get_bridges( self, p ):
+        return [ ( client, service ) for client, service in self.bridges
+            if p.get('client') in ( None, client ) and p.get('service') in ( None, service ) ]
+
+class mem_Session:
+    """
+    In Memory Database Session
+
+    Same interface as db_Session.
+
+    """
+    def __init__( self, model, profile=None, stats=None ):
+        self.model = model # Shared with any other session, as a database would be
+        self.stats = stats # Latency_Stats, if the stages of each command are timed
+        self.in_batch = False
+        self.journal = [] # Changes that can still be undone
+        self.failed_index = None # Of the call in a chunk that failed, see exec_batch()
+
+    def mogrify( self, cmd, pvals ):
+        return cmd.replace( "%s", "{}" ).format( *[ sql_literal( v ) for v in pvals ] )
+
+    def begin_batch( self ):
+        self.in_batch = True
+
+    def end_batch( self, commit ):
+        self.in_batch = False
+        if not commit:
+            self.model.undo( self.journal )
+        self.journal = []
+
+    def prepare_report( self ):
+        return None # Nothing is prepared
+
+    def exec_command( self, cmd, pvals, ovals, diagnostic_on, verbose_on, shape=None,
+            group=None ):
+        """
+        Execute a command and return the result.
+
+        """
+        if verbose_on:
+            print(  "----> [{}]".format( self.mogrify( "select * from " + cmd, pvals ) ) )
+        if diagnostic_on:
+            return None, None
+
+        start = time.perf_counter()
+        api_name, p = call_args( cmd, pvals, shape )
+        mark = len( self.journal )
+        try:
+            relations = self.model.call( api_name, p, self.journal )
+        except mi_DB_Error:
+            self.model.undo( self.journal, mark )
+            raise
+        if not self.in_batch:
+            self.journal = [] # Committed
+        if self.stats and group:
+            self.stats.record( group, ( ( 'server', time.perf_counter() - start ), ) )
+        return relations, ovals
+
+    def exec_batch( self, calls, verbose_on ):
+        """
+        Executes a chunk of ( cmd, pvals, shape ) calls that return nothing.
+        There are no round trips to save, so they are just applied in turn.  If
+        one fails, its position in the chunk is left in failed_index.
+
+        """
+        self.failed_index = None
+        for i, ( cmd, pvals, shape ) in enumerate( calls ):
+            self.failed_index = i
+            self.exec_command( cmd, pvals, None, False, verbose_on, shape )
+        self.failed_index = None
+
+    def bulk_report( self ):
+        return None # Nothing was saved
+
+    def close( self ):
+        """Closes the session, aborting any batch"""
+        if self.in_batch:
+            self.end_batch( commit=False )
@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+
+"""
+Model Name Mirror
+
+Keeps the names of the domains, subsystems and classes in the model so that
+a command naming one that doesn't exist, such as a misspelled class, can be
+rejected as it is translated, without a trip to the database.  In a batch
+file that means the mistake is reported before any part of the command is
+sent.
+
+The names are read once, in a single read only transaction, and then kept up
+to date by applying each call that adds, renames or deletes a domain,
+subsystem or class once it has succeeded.  Calls are checked just before
+they are sent, so replayed calls are checked too.  A chunk of calls sent in
+one round trip is checked and applied a call at a time, so each call sees
+the names created before it, and any change made by a call that isn't kept
+is rolled back.  Names of attributes and relationships can't be read
+through the API, so they are left to the database to check.
+
+Changes made by anyone other than this session are not seen, so the mirror
+is only used when requested.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import copy
+
+# Local
+from mi_Memory_DB import call_args, fail
+
+# Subjects whose names are mirrored
+MIRRORED = ( 'domain', 'subsys', 'class' )
+
+class Model_Mirror:
+    """
+    Model Name Mirror
+
+    """
+    def __init__( self, api ):
+        self.domains = {} # domain name : { 'subsys' : { names }, 'class' : { names } }
+        self.spec = {} # The domain build spec, which names a new domain's first subsystem
+        self.version = 0 # Counts changes to the names, so copies can tell when they're stale
+        self.undo = None # domain name : its entry, or None, before a tentative change
+        self.undo_spec = None
+        self.attach( api )
+
+    def attach( self, api ):
+        """
+        Uses the definitions of an API, as when it is read again.
+
+        """
+        self.api = api
+        # api function : { parameter : subject named, for each that must exist }
+        self.scopes = { plan['api']:plan['scopes'] for subject, plan in api.index.values() }
+
+    def read( self, editor, subject ):
+        """
+        Returns each row of a subject's show command, for the whole model
+        regardless of any focus, as a dictionary.
+
+        """
+        subject, plan = self.api.index[ ( subject, 'show' ) ]
+        relations, attrs = editor.exec_command( plan['prefix'] + ')', [], plan['olist'],
+                False, False, ( plan['api'], () ) )
+        return [ dict( zip( attrs, r ) ) for r in relations ]
+
+    def load( self, editor ):
+        """
+        Reads every domain, subsystem and class name in one transaction.
+
+        """
+        domains = {}
+        editor.begin_batch()
+        try:
+            for d in self.read( editor, 'domain' ):
+                domains[d['name']] = { 'subsys':set(), 'class':set() }
+            for s in self.read( editor, 'subsys' ):
+                domains[s['domain']]['subsys'].add( s['name'] )
+            for c in self.read( editor, 'class' ):
+                domains[c['domain']]['class'].add( c['name'] )
+            self.spec = self.read( editor, 'dbspec' )[0]
+        finally:
+            editor.end_batch( commit=False ) # Nothing was changed
+        self.domains = domains
+        self.version += 1
+
+    def check( self, cmd, pvals, shape ):
+        """
+        Raises an error like the database would if a call names a domain,
+        subsystem or class that doesn't exist.
+
+        """
+        scopes = self.scopes.get( shape[0] )
+        if not scopes:
+            return
+        api_name, p = call_args( cmd, pvals, shape )
+        domain = self.domains.get( p.get('domain') )
+        for pname, scope in scopes.items():
+            name = p.get( pname )
+            if name is None or scope not in MIRRORED:
+                continue
+            if scope == 'domain':
+                if name not in self.domains:
+                    fail( "Domain [{}] does not exist.".format( name ) )
+            elif domain is not None and name not in domain[scope]:
+                fail( "{} [{}] does not exist in domain [{}].".format(
+                    "Subsystem" if scope == 'subsys' else "Class", name, p['domain'] ) )
+
+    def apply( self, cmd, pvals, shape ):
+        """
+        Updates the names to match a call that has succeeded, or that is
+        applied tentatively, see tentative().
+
+        """
+        # UI_new_domain is applied by on_new_domain, and so on
+        on = getattr( self, 'on_' + shape[0].split( '_', 1 )[-1], None )
+        if on:
+            p = call_args( cmd, pvals, shape )[1]
+            if self.undo is not None:
+                # Keep what the change could touch, the first time
+                for key in ( p.get('domain'), p.get('name'), p.get('new_name') ):
+                    if key is not None and key not in self.undo:
+                        self.undo[key] = copy.deepcopy( self.domains.get( key ) )
+                if self.undo_spec is None:
+                    self.undo_spec = dict( self.spec )
+            on( p )
+            self.version += 1
+
+    def tentative( self ):
+        """
+        Starts applying calls that haven't been made yet, until commit() or
+        rollback().
+
+        """
+        self.undo = {}
+        self.undo_spec = None
+
+    def commit( self ):
+        """
+        Keeps the tentative changes.
+
+        """
+        self.undo = None
+        self.undo_spec = None
+
+    def rollback( self ):
+        """
+        Undoes the tentative changes.
+
+        """
+        for key, entry in self.undo.items():
+            if entry is None:
+                self.domains.pop( key, None )
+            else:
+                self.domains[key] = entry
+        if self.undo_spec is not None:
+            self.spec = self.undo_spec
+        self.commit()
+        self.version += 1
+
+    def rename( self, names, p ):
+        if p.get('new_name') is not None:
+            names.discard( p['name'] )
+            names.add( p['new_name'] )
+
+    def on_new_domain( self, p ):
+        domain = self.domains[p['name']] = { 'subsys':set(), 'class':set() }
+        if p.get('type') != 'realized':
+            # A modeled domain starts out with one subsystem
+            domain['subsys'].add( p['name'] if self.spec['domain_name_is_default_subsys_name']
+                else self.spec['default_subsys_name'] )
+
+    def on_delete_domain( self, p ):
+        self.domains.pop( p['name'], None )
+
+    def on_set_domain( self, p ):
+        if p.get('new_name') is not None:
+            self.domains[p['new_name']] = self.domains.pop( p['name'] )
+
+    def on_set_domain_build_spec( self, p ):
+        self.spec.update( ( k, v ) for k, v in p.items() if v is not None )
+
+    def on_new_subsystem( self, p ):
+        self.domains[p['domain']]['subsys'].add( p['name'] )
+
+    def on_delete_subsystem( self, p ):
+        self.domains[p['domain']]['subsys'].discard( p['name'] )
+
+    def on_set_subsystem( self, p ):
+        self.rename( self.domains[p['domain']]['subsys'], p )
+
+    def on_new_class( self, p ):
+        self.domains[p['domain']]['class'].add( p['name'] )
+
+    def on_delete_class( self, p ):
+        self.domains[p['domain']]['class'].discard( p['name'] )
+
+    def on_set_class( self, p ):
+        self.rename( self.domains[p['domain']]['class'], p )
+
+    def on_new_gen( self, p ):
+        # Any superclass or subclass not already defined is created
+        self.domains[p['domain']]['class'].update( [ p['superclass'] ] + p['subclasses'] )
+
+    def on_new_binary_assoc( self, p ):
+        if p.get('assoc_class'):
+            self.domains[p['domain']]['class'].add( p['assoc_class'] )
@@ -0,0 +1,302 @@
+#! /usr/bin/env python
+
+"""
+Pipelined Command Execution
+
+Normally each command is parsed, translated, sent to the database and its
+result printed before the next command is even read.  When the database is
+remote, a long command stream spends most of its time waiting on round trips.
+
+A Pipeline overlaps those stages.  Commands are parsed and translated ahead
+on the asyncio event loop while earlier calls are in flight on a dedicated
+database thread.  Each round trip carries every call that returns nothing
+translated by the time it is sent, see Session.call_batch(), so a stream of
+calls costs one round trip per batch rather than per call.  Calls run in
+command order and results are printed in that order, stopping at the first
+failure.  Model names (see mi_Mirror) are only checked and updated on the
+database thread, as each call is sent.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import io
+import sys
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Local
+_MODULE_DIR = os.path.abspath("../Modules")
+if _MODULE_DIR not in sys.path:
+    sys.path.append(_MODULE_DIR)
+from mi_Error import *
+
+# Maximum number of translated commands waiting to be executed
+PIPELINE_DEPTH = 64
+
+class Captured_Output:
+    """
+    Captured Output
+
+    Stands in for sys.stdout while a pipeline runs.  Anything written by a
+    thread that has a capture buffer set goes to that buffer instead, so that
+    it can be printed later in command order.  This includes error messages
+    printed by the database thread and by the translation of commands that
+    are ahead of what has been printed so far.
+
+    """
+    def __init__( self, stream ):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture( self, buffer ):
+        """
+        Sends this thread's output to buffer, or back to the stream if None.
+
+        """
+        self.local.buffer = buffer
+
+    def write( self, text ):
+        buffer = getattr( self.local, 'buffer', None )
+        return ( buffer if buffer is not None else self.stream ).write( text )
+
+    def flush( self ):
+        self.stream.flush()
+
+class Pipeline:
+    """
+    Pipeline
+
+    Runs a stream of commands through a Session.
+
+    """
+    def __init__( self, session, depth=PIPELINE_DEPTH ):
+        self.session = session
+        self.depth = depth
+        self.failed = False # Set by the first failure to stop the stream
+        self.executed = 0 # Number of commands completed
+        self.error = None # Any unexpected exception raised on the database thread
+
+    def run( self, lines, blocking_input=False ):
+        """
+        Processes each command line, stopping at the first failure.
+        If reading the next line may block, as with an input pipe, set
+        blocking_input so that lines are read without stalling the pipeline.
+
+        Returns the number of commands completed and whether all succeeded.
+
+        """
+        self.output = Captured_Output( sys.stdout )
+        sys.stdout = self.output
+        self.session.pipeline = self # A nested read must not start another pipeline
+        try:
+            asyncio.run( self.stream( lines, blocking_input ) )
+        finally:
+            sys.stdout = self.output.stream
+            self.session.pipeline = None
+        if self.error:
+            raise self.error
+        return self.executed, not self.failed
+
+    async def stream( self, lines, blocking_input ):
+        """
+        Translates commands ahead into a bounded queue drained by execute_all().
+
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue( self.depth )
+        db_thread = ThreadPoolExecutor( max_workers=1 ) # One round trip in flight, strict order
+        reader = ThreadPoolExecutor( max_workers=1 ) if blocking_input else None
+        consumer = asyncio.ensure_future( self.execute_all( queue, db_thread ) )
+
+        lines = iter( lines )
+        while not self.failed:
+            if reader:
+                line = await loop.run_in_executor( reader, next, lines, None )
+            else:
+                line = next( lines, None )
+            if line is None:
+                break
+
+            if self.session.is_ui_command( line ):
+                # A UI command may change state used in translation (focus)
+                # or print, so everything ahead of it must be finished first
+                await queue.join()
+                if self.failed:
+                    break
+                self.session.echo( line )
+                try:
+                    self.session.process( line )
+                except ( mi_Command_Error, mi_Quiet_Error ):
+                    self.session.report_failure()
+                    self.failed = True
+                    break
+                self.executed += self.session.note_applied( 1 )
+                continue
+
+            # Translate ahead, holding any error message until its turn to print
+            item = { 'line':line, 'command':None }
+            buffer = io.StringIO()
+            self.output.capture( buffer )
+            try:
+                item['command'] = self.session.translate( line )
+            except mi_Command_Error:
+                pass
+            finally:
+                self.output.capture( None )
+            item['output'] = buffer.getvalue()
+            await queue.put( item )
+            if not item['command']:
+                break # Nothing after a bad command will be executed
+
+        await queue.put( None ) # End of stream
+        await consumer
+        db_thread.shutdown()
+        if reader:
+            reader.shutdown( wait=False )
+
+    async def execute_all( self, queue, db_thread ):
+        """
+        Executes each translated command in order and prints its results.
+
+        """
+        loop = asyncio.get_running_loop()
+        held = [] # Item taken from the queue but not yet executed
+        while True:
+            item = held.pop() if held else await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            if self.failed:
+                queue.task_done()
+                continue # Discard anything translated after the failure
+
+            if self.batches( item ):
+                # Send every call ready to go that returns nothing in one round trip
+                batch = [ item ]
+                while len( batch ) < self.depth and not queue.empty():
+                    following = queue.get_nowait()
+                    if not self.batches( following ):
+                        held.append( following )
+                        break
+                    batch.append( following )
+                await self.execute_batch( batch, db_thread )
+                for i in batch:
+                    queue.task_done()
+                continue
+
+            self.session.echo( item['line'] )
+            print( item['output'], end="" ) # Any translation error
+            if not item['command']:
+                self.session.report_failure()
+                self.failed = True
+            else:
+                relations, attrs, output, elapsed = await loop.run_in_executor(
+                        db_thread, self.execute, item['command']
+                    )
+                print( output, end="" )
+                if relations is False:
+                    self.session.report_failure()
+                    self.failed = True
+                else:
+                    start = time.perf_counter()
+                    try:
+                        # Streamed rows are read as printed, which may fail
+                        self.session.show_result( relations, attrs )
+                    except mi_DB_Error:
+                        self.session.report_failure()
+                        self.failed = True
+                    finally:
+                        self.session.close_result( relations )
+                    if not self.failed:
+                        self.session.record_times( item['command'], elapsed,
+                                time.perf_counter() - start )
+                        self.executed += self.session.note_applied( 1 )
+            queue.task_done()
+
+    def batches( self, item ):
+        """
+        Returns True if an item's call can share a round trip with others.
+
+        """
+        return bool( item and item['command'] and not item['command']['ovals'] and
+                not item['output'] and not self.session.diagnostic )
+
+    async def execute_batch( self, batch, db_thread ):
+        """
+        Executes the calls of a batch of items in one round trip and echoes
+        their lines, up to any failure.
+
+        """
+        loop = asyncio.get_running_loop()
+        failed_index, output, elapsed = await loop.run_in_executor(
+                db_thread, self.call_batch, [ i['command'] for i in batch ]
+            )
+        kept = len( batch ) if failed_index is None else failed_index
+        for i in batch[:kept]:
+            self.session.echo( i['line'] )
+            self.session.record_times( i['command'], elapsed / len( batch ), 0.0 )
+        self.executed += self.session.note_applied( kept )
+        if failed_index is not None:
+            self.session.echo( batch[failed_index]['line'] )
+            print( output, end="" )
+            self.session.report_failure()
+            self.failed = True
+
+    def call_batch( self, commands ):
+        """
+        Runs on the database thread.  Returns the index of any call that
+        failed, or None, any output and the elapsed time.
+
+        """
+        buffer = io.StringIO()
+        self.output.capture( buffer )
+        start = time.perf_counter()
+        failed_index = None
+        try:
+            self.session.call_batch( commands )
+        except mi_DB_Error:
+            failed_index = self.session.failed_index
+        except Exception as e:
+            # Stop the stream and raise this once the pipeline has wound down
+            self.error = e
+            failed_index = 0
+        finally:
+            self.output.capture( None )
+        return failed_index, buffer.getvalue(), time.perf_counter() - start
+
+    def execute( self, command ):
+        """
+        Runs on the database thread.  Returns the relations, attrs, any output
+        and the elapsed time of the call.  Relations are False if the call failed.
+
+        """
+        buffer = io.StringIO()
+        self.output.capture( buffer )
+        start = time.perf_counter()
+        try:
+            relations, attrs = self.session.call( command )
+        except mi_DB_Error:
+            relations, attrs = False, None
+        except Exception as e:
+            # Stop the stream and raise this once the pipeline has wound down
+            self.error = e
+            relations, attrs = False, None
+        finally:
+            self.output.capture( None )
+        return relations, attrs, buffer.getvalue(), time.perf_counter() - start
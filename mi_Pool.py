@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+
+"""
+Database Connection Pool
+
+A db_Pool hands out connections to the miUML database and takes them back
+when a command or transaction is complete.  Connections are initialized
+(session settings and search path) once, when they are opened, and are
+reused until they sit idle for too long, at which point they are closed so
+that an idle editor does not pin a database backend.  A connection that has
+been idle for a while is checked before it is handed out again.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import sys
+import time
+import threading
+
+# Local
+_MODULE_DIR = os.path.abspath("../Modules")
+if _MODULE_DIR not in sys.path:
+    sys.path.append(_MODULE_DIR)
+from mi_Error import *
+
+# Connect to this database unless told otherwise by -dsn or the environment
+DEFAULT_DSN = os.environ.get( "MIUML_DSN", "dbname=miUML" )
+
+# Pool size limits
+DEFAULT_MIN = 0 # Idle connections kept open no matter how long they are idle
+DEFAULT_MAX = 4
+
+IDLE_TIMEOUT = 60.0 # Seconds before an idle connection beyond the minimum is closed
+CHECK_AFTER = 10.0 # Seconds idle before a connection is checked on checkout
+HEALTH_CHECK = "select 1"
+
+# Schemas holding the miUML metamodel and its API
+SEARCH_PATH = ( "set search_path to mi, mitrack, miuml, mitype, midom, miclass, "
+        "mirel, miform, mirrid, mistate, mipoly" )
+
+class db_Pool:
+    """
+    Database Connection Pool
+
+    Safe to share among threads.
+
+    """
+    def __init__( self, dsn=DEFAULT_DSN, minconn=DEFAULT_MIN, maxconn=DEFAULT_MAX,
+            init_commands=( SEARCH_PATH, ), idle_timeout=IDLE_TIMEOUT ):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = max( maxconn, minconn, 1 )
+        self.init_commands = init_commands # Run once on each new connection
+        self.idle_timeout = idle_timeout
+
+        self.idle = [] # ( connection, time returned ), most recently used last
+        self.info = {} # connection : per connection data, ex: prepared statements
+        self.opened = 0 # Connections currently open, idle or in use
+        self.lock = threading.Condition()
+        self.reaper = None # Thread that closes connections left idle too long
+
+    def open( self ):
+        """
+        Opens and initializes a new connection.
+
+        """
+        import psycopg2 # Deferred until a connection is actually required
+        try:
+            conn = psycopg2.connect( self.dsn )
+        except:
+            raise mi_Error( "Cannot connect to miUML database." )
+
+        conn.set_session(
+                isolation_level='serializable', readonly=False, autocommit=False
+            )
+        x = conn.cursor()
+        try: # Set the search path and anything else each connection needs
+            for command in self.init_commands:
+                x.execute( command )
+            conn.commit()
+        except:
+            conn.close()
+            raise mi_Error( "Cannot set the db search_path." )
+        x.close()
+        return conn
+
+    def healthy( self, conn ):
+        """
+        Returns True if the connection still works.
+
+        """
+        if conn.closed:
+            return False
+        try:
+            x = conn.cursor()
+            x.execute( HEALTH_CHECK )
+            x.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn( self ):
+        """
+        Returns a connection for exclusive use until it is given back
+        with putconn().  Waits if the maximum number are already in use.
+
+        """
+        while True:
+            conn = None
+            with self.lock:
+                while True:
+                    if self.idle:
+                        conn, returned = self.idle.pop()
+                        break
+                    if self.opened < self.maxconn:
+                        self.opened += 1
+                        break
+                    self.lock.wait()
+            if conn is None:
+                break
+            # Checked outside of the lock too, a dead server may not answer until a timeout
+            if time.monotonic() - returned < CHECK_AFTER or self.healthy( conn ):
+                return conn
+            with self.lock:
+                self.discard( conn ) # Broken while idle, try another
+
+        # Connect outside of the lock so other threads aren't held up
+        try:
+            conn = self.open()
+        except:
+            with self.lock:
+                self.opened -= 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.info[conn] = { 'prepared':{} }
+        return conn
+
+    def putconn( self, conn ):
+        """
+        Takes back a connection obtained with getconn().  Any transaction
+        must already be committed or rolled back.
+
+        """
+        with self.lock:
+            if conn.closed:
+                self.discard( conn )
+            else:
+                self.idle.append( ( conn, time.monotonic() ) )
+                self.start_reaper()
+            self.lock.notify()
+
+    def discard( self, conn ):
+        """
+        Closes a connection and forgets it.  Called with the lock held.
+
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.info.pop( conn, None )
+        self.opened -= 1
+        self.lock.notify()
+
+    def start_reaper( self ):
+        """
+        Starts the thread that closes idle connections, if it isn't running.
+        Called with the lock held.
+
+        """
+        if self.reaper or self.idle_timeout is None:
+            return
+        self.reaper = threading.Thread( target=self.reap, daemon=True )
+        self.reaper.start()
+
+    def reap( self ):
+        """
+        Closes connections, beyond the minimum, that have been idle too long.
+
+        """
+        with self.lock:
+            while self.reaper:
+                now = time.monotonic()
+                while len( self.idle ) > self.minconn and \
+                        now - self.idle[0][1] >= self.idle_timeout:
+                    conn, returned = self.idle.pop(0) # least recently used
+                    self.discard( conn )
+                self.lock.wait( self.idle_timeout / 2 )
+
+    def closeall( self ):
+        """
+        Closes every idle connection and stops reaping.
+
+        """
+        with self.lock:
+            self.reaper = None
+            while self.idle:
+                conn, returned = self.idle.pop()
+                self.discard( conn )
+            self.lock.notify_all()
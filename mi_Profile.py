@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+
+"""
+Startup Profile
+
+Records how long each phase of editor startup takes so that a breakdown
+can be printed when the editor is launched with -startup-profile.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import time
+
+class Startup_Profile:
+    """
+    Startup Profile
+
+    Each phase is timed from the end of the previous one.
+
+    """
+    def __init__( self, start=None ):
+        # Start time, ex: taken before any local modules were imported
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.phases = [] # ( phase name, elapsed seconds ) in order
+
+    def mark( self, phase, now=None ):
+        """
+        Ends the named phase.
+
+        """
+        now = now if now is not None else time.perf_counter()
+        self.phases.append( ( phase, now - self.last ) )
+        self.last = now
+
+    def report( self ):
+        """
+        Prints the elapsed time of each phase so far.
+
+        """
+        print()
+        print( "Startup profile" )
+        print( "---" )
+        for phase, elapsed in self.phases:
+            print( "{:<20}{:>10.2f} ms".format( phase, elapsed * 1000 ) )
+        print( "{:<20}{:>10.2f} ms".format( "total", ( self.last - self.start ) * 1000 ) )
+        print()
+
+    def report_phase( self, phase, elapsed ):
+        """
+        Prints a phase that happens after startup, such as the deferred
+        database connection, as soon as it is complete.
+
+        """
+        print( "startup profile: {} {:.2f} ms".format( phase, elapsed * 1000 ) )
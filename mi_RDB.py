@@ -22,7 +22,7 @@ Database Session
 import os
 import re
 import sys
-import psycopg2
+import time
 
 # Local
 _MODULE_DIR = os.path.abspath("../Modules")
@@ -30,46 +30,204 @@ if _MODULE_DIR not in sys.path:
     sys.path.append(_MODULE_DIR)
 from mi_Error import *
 from mi_Structured_File import Structured_File
-
-# Diagnostic
-import pdb # debug
+import mi_Structured_File
+import mi_Cache
+from mi_Pool import db_Pool
 
 # The variable 'x' is always a cursor in this module.
 
+# Constraint deferrals required by various api calls are defined here
+DEFERRALS_FILE = os.path.join( "Resources", "rdb.mi" )
+
 # Command used when deferring constraints
 DEFER_CMD = 'set constraints %s deferred'
 
+# Savepoint protecting each command inside a batch transaction
+SAVEPOINT = 'mi_command'
+
+# Savepoint protecting an attempt to prepare a statement
+PREPARE_SAVEPOINT = 'mi_prepare'
+
+# Prepared statements are named with this prefix and a serial number
+PREPARED_NAME = 'mi_stmt_{}'
+
+# Rows of a show command are read through a server side cursor of this name,
+# this many at a time, as they are printed.  Zero reads them all at once.
+STREAM_CURSOR = 'mi_stream'
+FETCH_SIZE = 1000
+
+# Calls sent in one round trip by exec_batch(), see the -bulk option
+BULK_SIZE = 100
+
+# With -coalesce, runs of at least this many calls of the same shape in a
+# chunk are sent as a single statement, see coalesce().  Experimental, so off
+# by default: its gain hasn't been measured against a server yet.
+COALESCE_MIN = 2
+
+def sql_literal( value ):
+    """
+    Renders a parameter value as a SQL literal.  Used to display a call
+    when there is no database connection to mogrify it, as in diagnostic mode.
+
+    """
+    if value is None:
+        return "NULL"
+    if isinstance( value, bool ):
+        return "true" if value else "false"
+    if isinstance( value, ( int, float ) ):
+        return repr( value )
+    return "'" + str( value ).replace( "'", "''" ) + "'"
+
+class Row_Stream:
+    """
+    Rows of a streamed command, see db_Session.exec_command(), read from
+    the server a batch at a time as they are iterated.  The command is
+    completed once the last row has been read.
+
+    """
+    def __init__( self, session, times, group ):
+        self.session = session
+        self.times = times # Stages timed so far
+        self.group = group
+        self.rows = iter( () ) # Of the batch being read
+        self.fetching = 0.0
+        self.open = True # Until the command is completed or undone
+
+    def __iter__( self ):
+        return self
+
+    def __next__( self ):
+        while self.open:
+            for r in self.rows:
+                return r
+            self.fetch()
+        raise StopIteration
+
+    def fetch( self ):
+        """
+        Reads the next batch of rows, completing the command if there are none.
+
+        """
+        s = self.session
+        clock = time.perf_counter
+        try:
+            start = clock()
+            rows = s.x.fetchmany( s.fetch_size )
+            self.fetching += clock() - start
+            if rows:
+                self.rows = iter( rows )
+                return
+            start = clock()
+            s.x.close()
+            s.x = s.conn.cursor()
+            s.finish_command()
+        except Exception as e:
+            self.open = False
+            s.abort_command()
+            raise mi_DB_Error( e.pgcode, e.pgerror )
+        self.open = False
+        s.release()
+        if s.stats and self.group:
+            s.stats.record( self.group, self.times +
+                    [ ( 'fetch', self.fetching ), ( 'commit', clock() - start ) ] )
+
+    def close( self ):
+        """
+        Undoes the command if its rows haven't all been read, ex: printing
+        failed, closing the cursor and giving back the connection.
+
+        """
+        if self.open:
+            self.open = False
+            self.session.abort_command()
+
 class db_Session:
     """ The miUML Editor Database Session"""
 
-    def __init__( self ):
+    def __init__( self, profile=None, pool=None, stats=None, fetch_size=FETCH_SIZE ):
         self.load_deferrals()
-        try:
-            self.conn = psycopg2.connect( "dbname=miUML" )
-        except:
-            raise mi_Error( "Cannot connect to miUML database." )
+        self.in_batch = False # True while a multi-command transaction is open
+        self.deferred = set() # Apis whose constraints are deferred in the open batch
+        self.profile = profile # Startup_Profile, if connection time should be reported
+        self.stats = stats # Latency_Stats, if the stages of each command are timed
+        self.fetch_size = fetch_size # Rows read at a time from a show command
 
-        self.conn.set_session(
-                isolation_level='serializable', readonly=False, autocommit=False
-            )
-        self.x = self.conn.cursor()
-        try: # Set the search path
-            self.x.execute( "set search_path to mi, mitrack, miuml, mitype, midom, miclass, "
-                    "mirel, miform, mirrid, mistate, mipoly" )
-            self.conn.commit()
-        except:
-            raise mi_Error( "Cannot set the db search_path." )
-        self.x.close()
+        # Connections come from a pool which may be shared with other sessions
+        self.pool = pool if pool else db_Pool()
+
+        # Prepared statement counters, see prepare_report()
+        self.prepare_stats = { 'hits':0, 'prepared':0, 'unprepared':0 }
+
+        # Bulk submission counters, see bulk_report()
+        self.bulk_stats = { 'calls':0, 'chunks':0, 'retried':0, 'coalesced':0, 'runs':0 }
+        self.failed_index = None # Of the call in a chunk that failed, see exec_batch()
+        self.coalesce_min = 0 # Shortest run coalesced, zero for none, see COALESCE_MIN
+        self.uncoalesced = set() # Shapes the server couldn't run coalesced, see coalesce()
+
+        # We don't connect until the first command that needs the database, so
+        # help, focus and diagnostic-only runs never touch it at all.  After that
+        # a connection is only held while a command or batch transaction is open.
+        self.conn = None
+        self.prepared = None # Prepared statements of the connection held, if any
+
+    def connect( self ):
+        """
+        Obtains a connection from the pool.
+
+        """
+        start = time.perf_counter()
+        self.conn = self.pool.getconn()
+
+        # Prepared statements belong to the connection
+        # call shape : execute command or None if it can't be prepared
+        self.prepared = self.pool.info[self.conn]['prepared']
+
+        if self.profile:
+            self.profile.report_phase( "db connect", time.perf_counter() - start )
+            self.profile = None # Only the first connection is part of startup
+
+    def release( self ):
+        """
+        Gives the connection back to the pool unless a batch transaction is open.
+
+        """
+        if self.conn and not self.in_batch:
+            self.pool.putconn( self.conn )
+            self.conn = None
+            self.prepared = None
+
+    def mogrify( self, cmd, pvals ):
+        """
+        Returns the command with its parameter values filled in, for display.
+
+        """
+        if not self.conn:
+            return cmd % tuple( sql_literal( v ) for v in pvals )
+        x = self.conn.cursor()
+        cmd_string = str( x.mogrify( cmd, pvals ) ).lstrip( "b" ) # convert from b string
+        x.close()
+        return cmd_string[1:-1] # strip single or double quotes
 
     def load_deferrals( self ):
-        """ Loads a dictionary of api_calls with required constraint deferrals """
+        """
+        Loads a dictionary of api_calls with required constraint deferrals and
+        the set constraints command that defers them, ready to send.
+
+        """
+        # Use the cached dictionaries unless the deferrals file or the parser has changed
+        cache_name = os.path.basename( DEFERRALS_FILE )
+        cache_sources = [ DEFERRALS_FILE, __file__, mi_Structured_File.__file__ ]
+        cached = mi_Cache.load( cache_name, cache_sources )
+        if cached is not None:
+            self.deferrals, self.defer_cmds = cached
+            return
         self.deferrals = {}
 
         # Read the file lines into a single 'deferrals' section
-        self.dfdata = Structured_File( os.path.join( "Resources", "rdb.mi" ) )
+        dfdata = Structured_File( DEFERRALS_FILE )
 
         current_api = ""
-        for record in self.dfdata.sections['deferrals']:
+        for record in dfdata.sections['deferrals']:
             # Each record in the deferrals section (the only section)
             # is either indented or it isn't.
             if record.startswith( ' ' ):
@@ -80,44 +238,356 @@ class db_Session:
                 current_api = record
                 self.deferrals[current_api] = []
 
-    def exec_command( self, cmd, pvals, ovals, diagnostic_on, verbose_on ):
+        # api_call : command deferring all of its constraints
+        self.defer_cmds = { api:DEFER_CMD % ", ".join( constraints )
+                for api, constraints in self.deferrals.items() if constraints }
+
+        mi_Cache.save( cache_name, cache_sources, ( self.deferrals, self.defer_cmds ) )
+
+    def begin_batch( self ):
+        """
+        Starts a transaction spanning many commands.  Until end_batch() is called
+        nothing is committed.  Each command is protected by a savepoint instead, so
+        a failed command can be reported and rolled back to that point.
+
         """
-        Execute a command and return the result
+        self.in_batch = True
+        self.deferred = set()
 
+    def end_batch( self, commit ):
         """
+        Commits or aborts everything executed since begin_batch() as a unit.
+
+        """
+        self.in_batch = False
+        self.deferred = set()
+        if not self.conn:
+            return # Nothing was executed (diagnostic mode)
+        try:
+            if not commit:
+                self.conn.rollback()
+                return
+            try:
+                self.conn.commit() # Any deferred constraints are checked now
+            except Exception as e:
+                self.conn.rollback()
+                raise mi_DB_Error( e.pgcode, e.pgerror )
+        finally:
+            self.release()
+
+    def prepare( self, shape ):
+        """
+        Prepares a server side statement for every call with the given shape
+        and returns the command that executes it with just the parameter values.
+        The shape is the api function name plus the name of each parameter
+        supplied and, for a list parameter, its number of elements.
+
+        Returns None if the server can't prepare the call, in which case calls
+        of this shape will always be sent as text.
+
+        """
+        api, params = shape
+        placeholders = []
+        n = 0 # Number of values
+        for pname, list_len in params:
+            if list_len is None:
+                n += 1
+                placeholders.append( "p_{}:=${}".format( pname, n ) )
+            else:
+                placeholders.append( "p_{}:=array[{}]".format( pname,
+                    ", ".join( "${}".format( i ) for i in range( n + 1, n + list_len + 1 ) ) ) )
+                n += list_len
+
+        name = PREPARED_NAME.format( len( self.prepared ) + 1 )
+        self.x.execute( "savepoint " + PREPARE_SAVEPOINT )
+        try:
+            self.x.execute( "prepare {} as select * from {}({})".format(
+                name, api, ", ".join( placeholders ) ) )
+            self.x.execute( "release savepoint " + PREPARE_SAVEPOINT )
+        except Exception:
+            # For example, the server could not infer a parameter type, so
+            # leave the transaction as it was and don't try this shape again
+            self.x.execute( "rollback to savepoint " + PREPARE_SAVEPOINT )
+            self.prepared[shape] = None
+            return None
+
+        self.prepared[shape] = "execute {}".format( name ) if not n else \
+                "execute {}({})".format( name, ", ".join( ["%s"]*n ) )
+        self.prepare_stats['prepared'] += 1
+        return self.prepared[shape]
+
+    def prepare_report( self ):
+        """
+        Returns a summary of prepared statement use, or None if there was none.
+
+        """
+        hits, prepared, unprepared = ( self.prepare_stats[k] for k in
+                ( 'hits', 'prepared', 'unprepared' ) )
+        calls = hits + prepared + unprepared
+        if not calls:
+            return None
+        return "prepared statements: {} hits, {} prepared, {} sent as text ({:.1f}% hit rate)".format(
+                hits, prepared, unprepared, 100.0 * hits / calls )
+
+    def bulk_report( self ):
+        """
+        Returns a summary of bulk submission, or None if there was none.
+
+        """
+        calls, chunks, retried, coalesced, runs = ( self.bulk_stats[k] for k in
+                ( 'calls', 'chunks', 'retried', 'coalesced', 'runs' ) )
+        if not chunks:
+            return None
+        return "bulk: {} calls in {} round trips ({:.1f} per trip), {} coalesced into {} statements, " \
+                "{} chunks retried a call at a time".format(
+                calls, chunks, calls / chunks, coalesced, runs, retried )
+
+    def coalesce( self, shape, count ):
+        """
+        Returns a statement that makes count calls of the same shape, in
+        order, taking the parameter values of each call in turn.  Values of
+        each call form a row of a values list, which the api function is
+        joined to, so the server makes every call in one statement:
+
+            select count(*) from ( select * from
+                    ( values (1, %s, %s), (2, %s, %s) ) as r( n, c1, c2 ) order by n
+                ) as v, lateral UI_new_ind_attr( p_name:=v.c1, p_class:=v.c2 )
+
+        SQL doesn't promise to read a values list in order, so each row is
+        numbered and sorted.  A subquery with order by isn't merged into the
+        join, so the calls are made in that order.
+
+        Returns None for a shape without parameters, or one that the server
+        has failed to run this way before.
+
+        """
+        api, params = shape
+        if not params or shape in self.uncoalesced:
+            return None
+        args = []
+        n = 0 # Number of values in each call
+        for pname, list_len in params:
+            if list_len is None:
+                n += 1
+                args.append( "p_{}:=v.c{}".format( pname, n ) )
+            else:
+                args.append( "p_{}:=array[{}]".format( pname,
+                    ", ".join( "v.c{}".format( i ) for i in range( n + 1, n + list_len + 1 ) ) ) )
+                n += list_len
+        row = ", ".join( ["%s"]*n )
+        return "select count(*) from ( select * from ( values {} ) as r( n, {} ) order by n ) as v, " \
+                "lateral {}( {} )".format(
+                ", ".join( "({}, {})".format( i, row ) for i in range( 1, count + 1 ) ),
+                ", ".join( "c{}".format( i ) for i in range( 1, n + 1 ) ),
+                api, ", ".join( args ) )
+
+    def exec_batch( self, calls, verbose_on ):
+        """
+        Executes a chunk of ( cmd, pvals, shape ) calls that return nothing, sent
+        to the server as a single multi-statement request.  Each call goes through
+        its prepared statement, as in exec_command().
+
+        With coalesce_min set (-coalesce), runs of consecutive calls of the
+        same shape, such as the new attr commands filling in a class, are
+        coalesced into one statement, see coalesce().
+
+        If the chunk fails, none of it is kept and the calls are retried one at
+        a time, so the error is raised by the call that actually failed.  Its
+        position in the chunk is left in failed_index and the calls before it
+        are kept.
+
+        """
+        self.failed_index = None
+        if not self.conn:
+            self.connect()
+        # Within a batch transaction the whole chunk is protected by one savepoint
+        statements = [ "savepoint " + SAVEPOINT ] if self.in_batch else []
+        values = []
+        deferring = set() # Apis whose constraints this chunk defers
+        coalesced = [] # ( shape, number of calls ) of each run sent as one statement
         self.x = self.conn.cursor()
+        try:
+            i = 0
+            while i < len( calls ):
+                cmd, pvals, shape = calls[i]
+                if shape[0] in self.defer_cmds and shape[0] not in self.deferred | deferring:
+                    statements.append( self.defer_cmds[shape[0]] )
+                    deferring.add( shape[0] )
+                run = 1
+                while i + run < len( calls ) and calls[i + run][2] == shape:
+                    run += 1
+                run_cmd = self.coalesce( shape, run ) \
+                        if self.coalesce_min and run >= self.coalesce_min else None
+                if run_cmd:
+                    statements.append( run_cmd )
+                    for cmd, pvals, shape in calls[i:i + run]:
+                        values += pvals
+                        if verbose_on:
+                            print(  "----> [{}]".format( self.mogrify( "select * from " + cmd, pvals ) ) )
+                    coalesced.append( ( shape, run ) )
+                    i += run
+                    continue
+                i += 1
+                if shape in self.prepared:
+                    execute_cmd = self.prepared[shape]
+                    if execute_cmd:
+                        self.prepare_stats['hits'] += 1
+                else:
+                    execute_cmd = self.prepare( shape )
+                if not execute_cmd:
+                    self.prepare_stats['unprepared'] += 1
+                statements.append( execute_cmd if execute_cmd else "select * from " + cmd )
+                values += pvals
+                if verbose_on:
+                    print(  "----> [{}]".format( self.mogrify( "select * from " + cmd, pvals ) ) )
+            self.x.execute( "; ".join( statements ), values )
+            self.finish_command()
+        except Exception:
+            self.abort_command()
+            self.bulk_stats['retried'] += 1
+            for i, ( cmd, pvals, shape ) in enumerate( calls ):
+                self.failed_index = i
+                self.exec_command( cmd, pvals, None, False, False, shape )
+            self.failed_index = None
+            # Every call succeeded on its own, so the server couldn't run a
+            # coalesced statement, ex: a parameter type it couldn't infer
+            self.uncoalesced.update( shape for shape, run in coalesced )
+            return
+        self.release()
+        if self.in_batch:
+            self.deferred |= deferring
+        self.bulk_stats['calls'] += len( calls )
+        self.bulk_stats['chunks'] += 1
+        self.bulk_stats['coalesced'] += sum( run for shape, run in coalesced )
+        self.bulk_stats['runs'] += len( coalesced )
 
-        # Set any deferrals required by this api
-        api_name = cmd.split('(')[0] # Left side of api, minus (params)
-        if api_name in self.deferrals: # Any constraints to defer?
-            # make a csv list of constraints and defer them for this transaction
-            defer_cmd = "set constraints " + ", ".join( self.deferrals[api_name] ) + " deferred"
+    def exec_command( self, cmd, pvals, ovals, diagnostic_on, verbose_on, shape=None,
+            group=None ):
+        """
+        Execute a command and return the result.  If the shape of the call is
+        supplied, it is executed through a prepared statement shared by all
+        calls of that shape.  If stats are kept, the time spent in each stage
+        is recorded under the group, ex: 'class new'.
+
+        The rows of a read only (get) call with output are streamed: they are
+        returned as a Row_Stream that reads them from the server as needed, and
+        the command is completed once the last row has been read.  The caller
+        must close() it, so a command whose rows aren't all read is undone.
 
-            if verbose_on:
-                defer_string = str( self.x.mogrify( defer_cmd ) ).lstrip( "b" )
-                print(  "====> [{}]".format( defer_string[1:-1] ) ) # strip single or double quotes
+        """
+        # Set any deferrals required by this api.  Within a batch they last
+        # until the transaction ends, so each api's are only sent once.
+        api_name = shape[0] if shape else cmd.partition('(')[0]
+        defer_cmd = None
+        if api_name not in self.deferred:
+            defer_cmd = self.defer_cmds.get( api_name )
 
-            self.x.execute( defer_cmd )
+        if not ( self.conn or diagnostic_on ):
+            self.connect() # First command that needs the database
 
         scmd = "select * from " + cmd
+        stream = self.fetch_size and ovals and api_name.split( '_', 1 )[-1].startswith( 'get' )
         if verbose_on:
-            cmd_string = str( self.x.mogrify( scmd, pvals ) ).lstrip( "b" ) # convert from b string
-            print(  "----> [{}]".format( cmd_string[1:-1] ) ) # strip single or double quotes
+            if defer_cmd:
+                print(  "====> [{}]".format( defer_cmd ) )
+            print(  "----> [{}]".format( self.mogrify( scmd, pvals ) ) )
         if diagnostic_on:
             return None, None
+
+        clock = time.perf_counter
+        times = [] # ( stage, seconds )
+        start = clock()
+        self.x = self.conn.cursor()
         try:
-            self.x.execute( scmd, pvals )
-            self.conn.commit()
+            if self.in_batch:
+                # Mark this command's starting point within the batch transaction
+                self.x.execute( "savepoint " + SAVEPOINT )
+            now = clock()
+            times.append( ( 'defer', now - start ) )
+            start = now
+
+            if stream:
+                # A server side cursor can't be declared for a prepared statement,
+                # but a show command is too rare to benefit from one anyway
+                if defer_cmd:
+                    self.x.execute( defer_cmd )
+                self.x.close()
+                self.x = self.conn.cursor( STREAM_CURSOR )
+                self.x.execute( scmd, pvals )
+                times.append( ( 'server', clock() - start ) )
+                return Row_Stream( self, times, group ), ovals
+
+            execute_cmd = None
+            if shape:
+                if shape in self.prepared:
+                    execute_cmd = self.prepared[shape]
+                    if execute_cmd:
+                        self.prepare_stats['hits'] += 1
+                else:
+                    execute_cmd = self.prepare( shape )
+                    now = clock()
+                    times.append( ( 'prepare', now - start ) )
+                    start = now
+                if not execute_cmd:
+                    self.prepare_stats['unprepared'] += 1
+
+            # Any deferral is sent in the same round trip as the call itself
+            self.x.execute( ( defer_cmd + "; " if defer_cmd else "" ) +
+                    ( execute_cmd if execute_cmd else scmd ), pvals )
+            now = clock()
+            times.append( ( 'server', now - start ) )
+            relations = self.x.fetchall()
+            start = clock()
+            times.append( ( 'fetch', start - now ) )
+            self.finish_command()
+            times.append( ( 'commit', clock() - start ) )
+            if defer_cmd and self.in_batch:
+                self.deferred.add( api_name )
         except Exception as e:
-            self.x.close()
+            self.abort_command()
             raise mi_DB_Error( e.pgcode, e.pgerror )
-        relations = self.x.fetchall()
-        self.x.close()
+        self.release()
+        if self.stats and group:
+            self.stats.record( group, times )
         return relations, ovals
 
+    def finish_command( self ):
+        """
+        Keeps the work of the command in progress.
+
+        """
+        if self.in_batch:
+            # Keep the work, but leave it uncommitted until the batch ends
+            self.x.execute( "release savepoint " + SAVEPOINT )
+        else:
+            self.conn.commit()
+        self.x.close()
+
+    def abort_command( self ):
+        """
+        Undoes the command in progress and gives back the connection.
+
+        """
+        try:
+            x = self.conn.cursor()
+            if self.in_batch:
+                # Undo just this command so the failure can be reported
+                # while the batch transaction remains usable
+                x.execute( "rollback to savepoint " + SAVEPOINT )
+            else:
+                self.conn.rollback()
+            x.close()
+            self.x.close()
+        except Exception:
+            pass # The connection is gone, the pool will discard it
+        self.release()
+
     def close( self ):
-        """Closes the session"""
-        self.conn.close()
+        """Closes the session, giving back any connection held"""
+        if self.conn:
+            if self.in_batch:
+                self.end_batch( commit=False )
+            self.release()
 
 
 
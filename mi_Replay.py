@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+
+"""
+Compiled Command Scripts
+
+Running a command file means lexing each line, parsing its args, filling in
+focus defaults and translating it into an API call, all before the database
+sees it.  For a script that is run over and over, such as a reference model
+loaded by every test run, that work always comes out the same.
+
+So a script can be compiled once into replay records, each holding the
+source line and its line number along with the translated call: an index
+into a table of call templates and the parameter values.  The records are
+kept in the compiled resource cache (see mi_Cache) under the content hash of
+the script and the focus defaults it starts with, so replaying the script
+again only costs the database time.
+
+UI commands aren't compiled, they are run as the script is replayed.  Focus
+commands are also run as the script is compiled, since they affect the
+translation of the commands after them.  Compiling stops at a refresh or
+read command, which could change the translation in ways not known until the
+script runs, or at a command that can't be translated.  That line and the
+rest of the script are kept as text and translated as they are replayed.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import io
+import sys
+import copy
+import hashlib
+import contextlib
+
+# Local
+from mi_Error import *
+import mi_Cache
+import mi_API
+
+# UI commands after which the rest of a script can't be compiled
+STOP_COMPILING = ( 'refresh', 'read' )
+
+def replay_name( lines, api ):
+    """
+    Returns the name of the cache entry for a script starting out with the
+    API's current focus defaults.
+
+    """
+    digest = hashlib.sha1( "".join( lines ).encode() )
+    digest.update( repr( sorted( api.get_all_defaults() ) ).encode() )
+    return "replay_" + digest.hexdigest()
+
+def replay_sources( session ):
+    """
+    Returns the files whose content the translation of a script depends on.
+
+    """
+    return [ session.api.cmd_file, mi_API.__file__, mi_API.mi_Structured_File.__file__,
+        sys.modules[type( session ).__module__].__file__, __file__ ]
+
+def compile_script( session, lines ):
+    """
+    Translates the commands of a script without running any.  Returns the
+    call templates, ( call, ovals, shape, group ), the replay records,
+    ( line number, line, template index or None, pvals ), and a copy of the
+    session's API with the focus defaults left by the script.  Model names
+    aren't checked, the mirror, if in use, checks each call as it is sent
+    when replayed, see Session.call().
+
+    """
+    compiler = copy.copy( session )
+    compiler.api = copy.deepcopy( session.api )
+    templates = []
+    template_index = {} # ( call, shape ) : index in templates
+    records = []
+    compiling = True
+    # Any error is reported when the line is replayed
+    with contextlib.redirect_stdout( io.StringIO() ):
+        for n, line in session.numbered_commands( lines ):
+            command = None
+            if compiling:
+                try:
+                    if not compiler.is_ui_command( line ):
+                        command = compiler.translate( line )
+                    else:
+                        ui_op = compiler.ui_alias[line.split( None, 1 )[0]]
+                        if ui_op == 'focus':
+                            compiler.translate( line )
+                        elif ui_op in STOP_COMPILING:
+                            compiling = False
+                except mi_Error:
+                    compiling = False
+            if not command:
+                records.append( ( n, line, None, None ) )
+                continue
+            key = ( command['call'], command['shape'] )
+            i = template_index.get( key )
+            if i is None:
+                i = template_index[key] = len( templates )
+                templates.append( ( command['call'], command['ovals'], command['shape'], command['group'] ) )
+            records.append( ( n, line, i, tuple( command['pvals'] ) ) )
+    return templates, records, compiler.api
+
+def load_script( session, lines ):
+    """
+    Returns the compiled templates and records of a script, compiling and
+    caching them unless they are already cached.
+
+    """
+    compiled = mi_Cache.load( replay_name( lines, session.api ), replay_sources( session ) )
+    if compiled is None:
+        templates, records, api = compile_script( session, lines )
+        compiled = ( templates, records )
+        save_script( session, lines, compiled )
+    return compiled
+
+def save_script( session, lines, compiled ):
+    """
+    Caches the compiled ( templates, records ) of a script.
+
+    """
+    mi_Cache.save( replay_name( lines, session.api ), replay_sources( session ), compiled )
+
+def replay_items( templates, records ):
+    """
+    Yields the line number, line and translated command, or None if it is
+    to be translated as it runs, of each replay record.
+
+    """
+    for n, line, i, pvals in records:
+        if i is None:
+            yield n, line, None
+            continue
+        call, ovals, shape, group = templates[i]
+        yield n, line, { 'call':call, 'pvals':list( pvals ), 'ovals':ovals,
+            'shape':shape, 'group':group, 'times':[] }
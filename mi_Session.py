@@ -25,12 +25,15 @@ displayed in the same window.
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 
 # System
+import io
 import re
 import sys
 import os
-
-# Diagnostic
-import pdb
+import copy
+import time
+import itertools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Local
 _MODULE_DIR = os.path.abspath("../Modules")
@@ -38,11 +41,24 @@ if _MODULE_DIR not in sys.path:
     sys.path.append(_MODULE_DIR)
 from mi_Error import *
 from mi_API import API
+from mi_Pipeline import Pipeline, Captured_Output
+from mi_Pool import db_Pool, DEFAULT_DSN, DEFAULT_MIN, DEFAULT_MAX
+from mi_Memory_DB import mem_Model, mem_Session
+from mi_Stats import Latency_Stats
+from mi_Show_Cache import Show_Cache, is_read_only
+from mi_Mirror import Model_Mirror
+from mi_Completer import Completer
+from mi_Journal import Command_Journal
+import mi_Check
+import mi_Daemon
+from mi_Client import DEFAULT_SOCKET
+import mi_Replay
 import mi_RDB
 
 COMMENT_CHAR = "#" # This is the comment character used in command files
 OP, SUB, ARGS = range(3) # enumeration for line parts
 UIOP, UIARGS = range(2)
+OUTPUT_BUFFER = 1 << 16 # Bytes of output held before writing in buffered mode
 # Class and class based methods used for all singletons
 # to save the hassle of creating single object variables
 
@@ -65,6 +81,68 @@ def strip_comment_ws( line ):
     # Content, but no comment, just strip whitespace
     return line.strip()
 
+# Runs of a single character class used by lex_args.  Each is matched at a
+# given position and never backtracks, so no char is scanned more than twice.
+WORD_RUN = re.compile( r'\w+' )
+SPACE_RUN = re.compile( r'\s*' )
+VALUE_RUN = re.compile( r'[\w\/\.\s]*' ) # Chars that can appear in a name
+LIST_RUN = re.compile( r'[\w\/\.\s,]*' ) # Names and commas
+
+def lex_args( arg_text ):
+    """
+    Argument Lexer
+
+    Yields an ( arg, value, pattern ) triple for each argument in the text,
+    left to right, where pattern is one of:
+
+        'list'  -subclasses On Duty ATC, Off Duty ATC
+                value is the list of comma separated names
+        'value' -c Air Traffic Control
+                value is the text up to the next - or other char
+                that can't appear in a name
+        'flag'  -force
+                value is True, must be followed by another arg or nothing
+
+    The text is scanned once from left to right without backtracking, so
+    the time taken is proportional to its length no matter how long the
+    line or how many names are in a list.
+
+    """
+    text = arg_text.strip()
+    n = len( text )
+    i = 0
+    while i < n:
+        r = WORD_RUN.match( text, i + 1 ) if text[i] == '-' else None
+        if not r:
+            raise mi_Syntax_Error( "<op> <subject> [<args>]" )
+        arg, arg_end = r.group(), r.end()
+        i = SPACE_RUN.match( text, arg_end ).end()
+
+        if i > arg_end and WORD_RUN.match( text, i ):
+            # Value, up to the first char that can't be in a name
+            value_start = i
+            i = VALUE_RUN.match( text, i ).end()
+            # A comma followed by another name makes it a list
+            if i < n and text[i] == ',' and \
+                    WORD_RUN.match( text, SPACE_RUN.match( text, i + 1 ).end() ):
+                i = LIST_RUN.match( text, i ).end()
+                yield arg, [ x.strip() for x in text[value_start:i].split(",") ], 'list'
+            else:
+                yield arg, text[value_start:i].strip(), 'value'
+            end = i
+        elif i == n or text[i] == '-':
+            # Flag, followed by nothing or another arg
+            yield arg, True, 'flag'
+            end = arg_end
+        else:
+            raise mi_Syntax_Error( "<op> <subject> [<args>]" )
+
+        # Anything after an item that ends on the second to last char is
+        # ignored, ex: the ! in -name Foo!
+        if end >= n - 1:
+            return
+        i = SPACE_RUN.match( text, end ).end()
+
 class Session_Spec:
     """
     Session Specification
@@ -81,46 +159,6 @@ class Session_Spec:
         self.license = ("This program is distributed under the GNU Lesser General\n"
                 "Public License as part of the miUML metamodel library.")
 
-        # Each pair of function, pattern pairs extracts arg name, arg value, and match end
-        # for the specified arg value pattern
-        self.arg_extract = (
-
-                # arg with list of values ex: -subclasses On Duty ATC, Off Duty ATC
-                ( lambda r: (
-                        r.group('arg'),
-                        # break out each : cluster into a tuple
-                        [x.strip() for x in r.group('value').split(",")],
-                        r.end('value'),
-                        'list'
-                    ),
-                    re.compile( r'^-(?P<arg>\w+)\s+(?P<value>\w[\w\/\.\s]*,\s*\w[\w\/\.\s,]*)' ),
-                        # There must be a comma after the first value and then
-                        # alternating text and commas okay up to the next - arg marker
-                        # This is constrained just enough to detect the comma-list pattern
-                        # but not enough to detect malformed names containing commas
-                ),
-
-                # arg with single scalar value ex: -c Air Traffic Control
-                ( lambda r: (
-                            r.group('arg'),
-                            r.group('value').strip(),
-                            r.end('value'),
-                            'value'
-                        ),
-                        re.compile( r'^-(?P<arg>\w+)\s+(?P<value>\w[\w\/\.\s]*)' ),
-                ),
-
-                # arg name only to represent the setting of a flag ex: -force
-                ( lambda r: (
-                        r.group('arg'),
-                        True,
-                        r.end('arg'),
-                        'flag'
-                    ),
-                    re.compile( r'^-(?P<arg>\w+)\s*(-.*)?$' )
-                )
-            )
-
 class Session:
     """
     Session
@@ -129,41 +167,117 @@ class Session:
 
     """
     def __init__( self,
-            launch_dir, api_args, cmd_files, interactive, piped_input, diagnostic, verbose ):
+            launch_dir, api_args, cmd_files, interactive, piped_input, diagnostic, verbose,
+            options=None ):
 
         # Set passed in values and link to my Session Specification
         self.launch_dir = launch_dir
         self.api_args = api_args # These args are passed through to the API
         self.spec = Session_Spec()
         self.verbose = verbose # initial setting passed in from the command line
+        self.cmd_files = cmd_files
         self.diagnostic = diagnostic # initial setting passed in from the command line
 
+        # Any other command line options, ex: { 'transaction':True }
+        self.options = options if options else {}
+        self.pipeline = None # The Pipeline currently running commands, if any
+        self.completer = None # Completes commands typed at the prompt, if interactive
+        profile = self.options.get('startup_profile') # Startup_Profile or None
+
+        # In quiet mode commands from files and pipes are not echoed, only
+        # failures and a final summary are reported
+        self.quiet = self.options.get('quiet', False)
+        self.current_line = None # Last command echoed (or not, if quiet)
+        if self.options.get('buffered'):
+            # Write output in large blocks rather than a line at a time
+            sys.stdout.flush()
+            sys.stdout = io.TextIOWrapper(
+                    open( sys.stdout.fileno(), 'wb', buffering=OUTPUT_BUFFER, closefd=False ),
+                    encoding=sys.stdout.encoding, errors=sys.stdout.errors
+                )
+
         # Initialize the API
         self.api = API( *api_args )
+        if profile:
+            profile.mark( "api load" )
 
         # Initialized UI specific (non-API) features
         self.ui_cmd = {}
         self.ui_alias = {}
         self.exit_commands = ['q', 'quit', 'exit', 'ciao', 'bye']
         self.init_ui_cmd()
-
-        # Initialize the DB session
-        self.editor = mi_RDB.db_Session()
+        if profile:
+            profile.mark( "ui commands" )
+
+        # Time spent in each stage of each command, see the stats command
+        self.stats = Latency_Stats()
+
+        # Journal of the command file being processed with -resume, see note_applied()
+        self.journal = None
+
+        # Recent show results, if requested, see mi_Show_Cache
+        self.show_cache = Show_Cache( self.api, self.options['show_cache'] ) \
+                if self.options.get('show_cache') else None
+
+        # Initialize the DB session (the connection is opened on first use)
+        self.pool = None
+        self.model = None
+        if self.options.get('backend') == 'memory':
+            # Stand-in for the database, the model is kept in memory
+            self.model = mem_Model()
+            self.journals = {} # As are journals of the files applied to it, see open_journal()
+        else:
+            # Connections are pooled, so -j workers can have their own.  A
+            # daemon always keeps one open for the next client, see mi_Daemon.
+            pool_min = self.options.get('pool_min', DEFAULT_MIN)
+            if self.options.get('daemon'):
+                pool_min = max( pool_min, 1 )
+            self.pool = db_Pool(
+                    self.options.get('dsn', DEFAULT_DSN),
+                    pool_min,
+                    max( self.options.get('pool_max', DEFAULT_MAX), self.options.get('jobs', 1) )
+                )
+        self.editor = self.new_editor( profile )
+        self.mirror = None
+        if self.options.get('mirror'):
+            # Check names locally, see mi_Mirror
+            self.mirror = Model_Mirror( self.api )
+            self.reload_mirror()
+        if profile:
+            profile.mark( "db session" )
+            profile.report()
+
+        if self.options.get('daemon'):
+            # Serve clients instead of reading commands here
+            succeeded = mi_Daemon.serve( self, self.options.get('socket', DEFAULT_SOCKET) )
+            self.close()
+            exit(0 if succeeded else 1)
 
         # Special handling of stdio if a command file is piped in
         if piped_input:
             self.mode = "piped"
             self.interact()
             if not cmd_files and not interactive:
+                self.close()
                 exit(0)
             if interactive:
                 # Switch standard input to tty for interactive session
                 sys.stdin = open('/dev/tty', 'r')
+        if cmd_files and self.options.get('check') and not self.check_command_files( cmd_files ):
+            self.close()
+            exit(1)
+        if cmd_files and self.options.get('compile'):
+            succeeded = self.compile_command_files( cmd_files )
+            self.close()
+            exit(0 if succeeded else 1)
         if cmd_files:
             self.mode = "batch"
-            self.process_command_files( cmd_files, interactive )
+            if self.options.get('jobs', 1) > 1:
+                self.process_command_files_concurrently( cmd_files, interactive )
+            else:
+                self.process_command_files( cmd_files, interactive )
             if not interactive:
-                self.editor.close()
+                self.close()
                 exit(0)
 
         # Start prompting for commands
@@ -171,28 +285,64 @@ class Session:
         self.interact()
 
         # User ended the command session, clean up and quit
+        self.close()
+
+    def new_editor( self, profile=None ):
+        """
+        Returns a new database session on the selected backend.
+
+        """
+        if self.model:
+            return mem_Session( self.model, profile, self.stats )
+        editor = mi_RDB.db_Session( profile, self.pool, self.stats,
+                self.options.get( 'fetch_size', mi_RDB.FETCH_SIZE ) )
+        if self.options.get('coalesce'):
+            editor.coalesce_min = mi_RDB.COALESCE_MIN
+        return editor
+
+    def close( self ):
+        """
+        Ends the database session and closes all pooled connections.
+        Writes the command stats if requested.
+
+        """
         self.editor.close()
+        if self.pool:
+            self.pool.closeall()
+        if self.options.get('stats_file'):
+            self.stats.dump( self.options['stats_file'] )
+        sys.stdout.flush()
+
+    def echo( self, line ):
+        """
+        Echoes a command read from a file or pipe, unless quiet.
+
+        """
+        self.current_line = line # Reported if it fails
+        if not self.quiet:
+            sys.stdout.write( "* " + line + "\n" )
+
+    def report_failure( self ):
+        """
+        In quiet mode, reports the command that failed after its error message.
 
-    def extract_arg_item( self, arg_text ):
         """
-        Extracts the leftmost argument name - value pair from the supplied text
-        and returns the end char position of the matched text.
+        if self.quiet and self.current_line:
+            sys.stdout.write( "Failed: * " + self.current_line + "\n" )
 
+    @staticmethod
+    def numbered_commands( lines ):
         """
-        for f, p in self.spec.arg_extract: # function, pattern
-            r = p.match( arg_text ) # Matches leftmost arg-value pair, if any
-            if r:
-                # Apply the extraction function for this pattern
-                a, v, match_end, pattern = f( r )
-                # Chop off what we just extracted on the left
-                arg_text = None if match_end >= len( arg_text ) - 1 \
-                    else arg_text[match_end:].lstrip()
-                return a, v, pattern, arg_text
+        Yields the line number and text of each command in a script.
 
-        # No pattern matched
-        raise mi_Syntax_Error( "<op> <subject> [<args>]" )
+        """
+        for n, line in enumerate( lines, 1 ):
+            line = strip_comment_ws( line )
+            if line:
+                yield n, line
 
-    def parse_app_args( self, arg_text ):
+    @staticmethod
+    def parse_app_args( arg_text ):
         """
         Simple version of parse_ui_args which does no validation.  It simply
         produces the arg_map which can be later validated by the api.
@@ -213,9 +363,7 @@ class Session:
         # strip it and remove any internal single or double quotes
         arg_text = arg_text.strip().replace("'","").replace('"',"")
 
-        match_end = 0 # total length of matched groups for line chopping
-        while arg_text:
-            a, v, pattern, arg_text = self.extract_arg_item( arg_text )
+        for a, v, pattern in lex_args( arg_text ):
             arg_map[a] = v
             # pattern not used for app args
 
@@ -233,9 +381,7 @@ class Session:
         fset = set() # For grouping comparison
 
         # Build the arg map
-        match_end = 0 # total length of matched groups for line chopping
-        while arg_text:
-            a, v, pattern, arg_text = self.extract_arg_item( arg_text )
+        for a, v, pattern in lex_args( arg_text ):
 
             if pattern == 'value': # matches arg value pattern, ex: -s domain
                 # validate( a ) # validate_uiarg(a) or validate_apparg(a)
@@ -270,7 +416,9 @@ class Session:
                 raise mi_Syntax_Error( self.ui_cmd[op]['help'] )
 
             # Add arg_map entry a, v, will overwrite any duplicate
-            arg_map[ self.ui_cmd[op]['syntax'][a]['var'] ] = v.strip() if v else None
+            # (switches carry a True value rather than text)
+            arg_map[ self.ui_cmd[op]['syntax'][a]['var'] ] = \
+                    v.strip() if isinstance( v, str ) else v
 
             # Update group
             fset.add(a)
@@ -310,6 +458,10 @@ class Session:
 
         """
         self.api = API( *self.api_args )
+        if self.mirror:
+            self.mirror.attach( self.api )
+        if self.show_cache:
+            self.show_cache = Show_Cache( self.api, self.show_cache.size )
 
     def ui_help( self, arg_map=None ):
         """
@@ -354,6 +506,21 @@ class Session:
         print( "Diagnostic mode {}".format( "ON" if self.diagnostic else "OFF") )
 
     
+    def ui_stats( self, arg_map ):
+        """
+        Prints the time spent in each stage of the commands processed so far,
+        by subject and op, and optionally starts over.
+
+        """
+        self.stats.report()
+        if self.show_cache:
+            print( self.show_cache.report() )
+        if arg_map.get('reset'):
+            self.stats.reset()
+            if self.show_cache:
+                self.show_cache.reset()
+            print( "Stats reset" )
+
     def ui_focus( self, arg_map ):
         """
         Sets or clears a focus attribute, or clears all focus attributes.
@@ -385,7 +552,7 @@ class Session:
     def ui_process_cmd_file( self, arg_map ):
         """
         Reads and processes a single command file during an interactive
-        session.
+        session.  With -tx, the whole file is applied in a single transaction.
 
         """
         cmd_file = arg_map['file'] if os.path.isabs(arg_map['file']) else \
@@ -395,28 +562,14 @@ class Session:
         except IOError:
             mi_File_Error("Could not open", cmd_file )
             return
-        print()
-        print("Reading file: " + cmd_file )
-        print ()
 
+        resume_mode = self.mode # interactive or piped
         self.mode = "file"
-        for command in cf:
-            command = strip_comment_ws( command )
-            if not command:
-                continue
-            print( "* " + command )
-            try:
-                self.process( command )
-            except mi_Quiet_Error:
-                print()
-                print( "Aborted file: " + cmd_file )
-                print()
-                return # to interactive session
-            finally:
-                self.mode = "interactive"
-        print()
-        print( "End of file: " + cmd_file )
-        print()
+        try:
+            self.process_file( cmd_file, cf, arg_map.get('transaction', False) )
+        finally:
+            cf.close()
+            self.mode = resume_mode
 
     def init_ui_cmd( self ):
         """
@@ -427,8 +580,9 @@ class Session:
                 'func':Session.ui_process_cmd_file,
                 'syntax':{
                             'f':{'action':'store', 'var':'file'},
+                            'tx':{'action':'switch', 'var':'transaction'},
                     },
-                'grouping':( ('f') ),
+                'grouping':( ('f'), ('f', 'tx') ),
                 'help':""
             }
 
@@ -471,6 +625,15 @@ class Session:
                     'help':"" # generated below
                 }
 
+        self.ui_cmd['stats'] = {
+                    'func':Session.ui_stats,
+                    'syntax':{
+                            'r':{'action':'switch', 'var':'reset'}
+                        },
+                    'grouping':( (), ('r') ),
+                    'help':""
+                }
+
         self.ui_cmd['h'] = {
                     'func':Session.ui_help,
                     'syntax':{},
@@ -487,7 +650,8 @@ class Session:
                 'r':'refresh', 'refresh':'refresh',
                 'read':'read', 'run':'read',
                 'diagnostic':'diagnostic', 'd':'diagnostic',
-                'verbose':'verbose', 'v':'verbose'
+                'verbose':'verbose', 'v':'verbose',
+                'stats':'stats'
             }
 
         # Create help syntax dictionary with entry for each command
@@ -532,33 +696,444 @@ class Session:
         fails unless interactive mode has been requested.
 
         """
-        for cmd_fname in cmd_files:
-            print()
-            print("Reading file: " + cmd_fname )
-            print()
+        total, start = 0, time.perf_counter()
+        for i, cmd_fname in enumerate( cmd_files, 1 ): # A file may be given more than once
             try:
                 cf = open( cmd_fname )
-            except:
+            except IOError:
                 mi_File_Error("Could not open", cmd_fname )
-            for command in cf:
-                command = strip_comment_ws( command )
-                if not command:
-                    continue
-                print( "* " + command )
-                try:
+                succeeded = False
+            else:
+                with cf:
+                    succeeded, cmd_count, elapsed = self.process_file(
+                            cmd_fname, cf, self.options.get('transaction', False)
+                        )
+                total += cmd_count
+            if self.quiet and ( not succeeded or i == len( cmd_files ) ):
+                self.summary( total, time.perf_counter() - start,
+                        "{} of {} files".format( i, len( cmd_files ) ),
+                        succeeded )
+            if not succeeded:
+                # If a command fails, no point in reading the rest of the files
+                # since the error will likely cascade.  Stop processing files.
+                if not interactive:
+                    self.close()
+                    exit(1)
+                return # Will enter an interactive session
+
+    def check_command_files( self, cmd_files ):
+        """
+        Translates every line of every command file without running any,
+        see mi_Check, and prints each error found with its file and line.
+
+        Returns True if no errors were found.
+
+        """
+        start = time.perf_counter()
+        results = mi_Check.check_files( self, cmd_files, carried=self.options.get('jobs', 1) <= 1 )
+        cmd_count = 0
+        error_count = 0
+        for cmd_fname, result in zip( cmd_files, results ):
+            if result is None:
+                print( "{}: Could not open".format( cmd_fname ) )
+                error_count += 1
+                continue
+            count, errors = result
+            cmd_count += count
+            error_count += len( errors )
+            for n, line, message in errors:
+                print( "{}, line {}: {}".format( cmd_fname, n, message ) )
+                print( "    " + line )
+        print( "Checked {} commands in {} files in {:.3f} s: {}".format(
+            cmd_count, len( cmd_files ), time.perf_counter() - start,
+            "{} errors, nothing was run".format( error_count ) if error_count else "no errors" ) )
+        return not error_count
+
+    def compile_command_files( self, cmd_files ):
+        """
+        Compiles each command file for replay without running any of it,
+        see mi_Replay.  Each file starts out with the focus left by the one
+        before, as it would when they are run.
+
+        Returns False if a file could not be read.
+
+        """
+        for cmd_fname in cmd_files:
+            try:
+                with open( cmd_fname ) as cf:
+                    lines = list( cf )
+            except IOError:
+                mi_File_Error("Could not open", cmd_fname )
+                return False
+            start = time.perf_counter()
+            templates, records, api = mi_Replay.compile_script( self, lines )
+            mi_Replay.save_script( self, lines, ( templates, records ) )
+            self.api = api
+            compiled = sum( 1 for r in records if r[2] is not None )
+            print( "Compiled {}: {} of {} commands as {} call templates in {:.3f} s{}".format(
+                cmd_fname, compiled, len( records ), len( templates ), time.perf_counter() - start,
+                "" if all( r[2] is not None or self.is_ui_command( r[1] ) for r in records )
+                else ", the rest are translated as they run" ) )
+        return True
+
+    def process_command_files_concurrently( self, cmd_files, interactive ):
+        """
+        Process command files that build unrelated parts of the model at the same
+        time, up to the number of jobs requested.  Each file gets its own
+        database connection and focus state, starting from the current focus.
+        The output of each file is printed, in file order, once it is complete,
+        followed by a throughput summary.  Exits if any file fails unless
+        interactive mode has been requested.
+
+        """
+        jobs = self.options['jobs']
+        output = Captured_Output( sys.stdout ) # Keeps each file's output together
+        sys.stdout = output
+
+        def process_one( cmd_fname ):
+            buffer = io.StringIO()
+            output.capture( buffer )
+            worker = self.file_worker()
+            try:
+                with open( cmd_fname ) as cf:
+                    result = worker.process_file(
+                            cmd_fname, cf, self.options.get('transaction', False)
+                        )
+            except IOError:
+                mi_File_Error("Could not open", cmd_fname )
+                result = ( False, 0, 0.0 )
+            finally:
+                worker.editor.close()
+                output.capture( None )
+            return result, buffer.getvalue()
+
+        start = time.perf_counter()
+        results = []
+        try:
+            with ThreadPoolExecutor( max_workers=jobs ) as pool:
+                for cmd_fname, future in [ ( f, pool.submit( process_one, f ) ) for f in cmd_files ]:
+                    result, text = future.result()
+                    print( text, end="" )
+                    results.append( ( cmd_fname, ) + result )
+        finally:
+            sys.stdout = output.stream
+        elapsed = time.perf_counter() - start
+
+        print( "{} files with up to {} jobs in {:.3f} s".format( len( cmd_files ), jobs, elapsed ) )
+        total = 0
+        for cmd_fname, succeeded, cmd_count, file_elapsed in results:
+            total += cmd_count
+            print( "  {:<8}{:>8} commands {:>9.3f} s {:>10.1f} commands/s  {}".format(
+                "ok" if succeeded else "ABORTED", cmd_count, file_elapsed,
+                cmd_count / file_elapsed if file_elapsed else 0.0, cmd_fname ) )
+        print( "{} commands overall, {:.1f} commands/s wall clock".format(
+            total, total / elapsed if elapsed else 0.0 ) )
+        print()
+
+        if not all( r[1] for r in results ) and not interactive:
+            self.close()
+            exit(1)
+
+    def file_worker( self ):
+        """
+        Returns a copy of this session with its own focus state and its own
+        database session, so that it can process a command file alongside others.
+
+        """
+        worker = copy.copy( self )
+        worker.api = copy.deepcopy( self.api ) # Focus defaults are kept in the API
+        worker.editor = self.new_editor()
+        # Results read by one worker could be changed by another's transaction
+        worker.show_cache = None
+        worker.mirror = None # Nor would names created by other workers be seen
+        # Each worker already runs alongside others, so it doesn't pipeline
+        worker.options = dict( self.options, pipelined=False )
+        worker.mode = "batch"
+        return worker
+
+    def summary( self, cmd_count, elapsed, source, succeeded ):
+        """
+        Prints the one line summary of a quiet run.
+
+        """
+        print( "{} commands from {} in {:.3f} s ({:.1f} commands/s){}".format(
+            cmd_count, source, elapsed, cmd_count / elapsed if elapsed else 0.0,
+            "" if succeeded else ", FAILED" ) )
+
+    def process_file( self, cmd_fname, cf, transaction ):
+        """
+        Process each command (line) from an open command file, stopping at the
+        first failure.  If transaction is set, the whole file is applied as a
+        single database transaction with a savepoint protecting each command,
+        so the file either commits or aborts as a unit.
+
+        Returns whether every command succeeded, the number of commands
+        processed and the elapsed time.
+
+        """
+        if not self.quiet:
+            print()
+            print( "Reading file: " + cmd_fname + ( " (single transaction)" if transaction else "" ) )
+            print()
+
+        if transaction:
+            self.editor.begin_batch()
+
+        cmd_count = 0 # for the throughput summary
+        start = time.perf_counter()
+        lines = list( cf )
+        numbered = list( self.numbered_commands( lines ) )
+        journal = None
+        outer_journal = self.journal # Of the file that read this one, if any
+        skipped = 0
+        replay = self.options.get('replay') and not ( self.diagnostic or self.pipeline )
+        try:
+            if replay:
+                # Compiled from the focus at the start of the file
+                compiled = mi_Replay.load_script( self, lines )
+            if self.options.get('resume') and not self.diagnostic:
+                # Skip the commands already applied by an earlier run, see mi_Journal
+                journal = self.open_journal( cmd_fname )
+                skipped = self.skip_applied( journal, numbered )
+                journal.begin( numbered, skipped, deferred=transaction )
+                self.journal = journal
+            commands = ( line for n, line in numbered[skipped:] )
+            if replay:
+                # Run the calls compiled from the script, see mi_Replay
+                cmd_count, succeeded = self.process_bulk( cmd_fname, itertools.islice(
+                        mi_Replay.replay_items( *compiled ), skipped, None ), self.options.get('bulk') )
+            elif self.options.get('bulk') and not ( self.diagnostic or self.pipeline ):
+                # Send runs of calls a chunk per round trip
+                cmd_count, succeeded = self.process_bulk( cmd_fname,
+                        ( ( n, line, None ) for n, line in numbered[skipped:] ),
+                        self.options['bulk'] )
+            elif self.options.get('pipelined') and not self.pipeline:
+                # Parse and translate ahead while earlier calls are in flight
+                cmd_count, succeeded = Pipeline( self ).run( commands )
+            else:
+                for command in commands:
+                    self.echo( command )
                     self.process( command )
-                except:
-                    # If a command fails, no point in reading the rest of the file
-                    # since the error will likely cascade.  Stop processing files.
-                    print()
-                    print( "Aborted file: " + cmd_fname )
-                    print()
-                    if not interactive:
-                        exit(1)
-                    return # Will enter an interactive session
+                    cmd_count += self.note_applied( 1 )
+                succeeded = True
+            if succeeded and transaction:
+                self.editor.end_batch( commit=True ) # Deferred constraints checked here
+                if journal:
+                    journal.commit()
+        except Exception:
+            self.report_failure()
+            succeeded = False
+        finally:
+            # Whatever was applied is already in the journal, even if interrupted
+            self.journal = outer_journal
+            if journal:
+                journal.close()
+
+        if not succeeded:
+            if transaction and self.editor.in_batch:
+                self.editor.end_batch( commit=False ) # Nothing from this file is kept
+            if transaction and self.show_cache:
+                self.show_cache.clear() # Results read within the transaction are gone too
+            if transaction and self.mirror:
+                self.reload_mirror() # As are any names added
+            if journal:
+                # None are kept under -tx
+                print( self.resume_report( skipped, 0 if transaction else cmd_count ) )
             print()
-            print( "End of file: " + cmd_fname )
+            print( "Aborted file: " + cmd_fname )
             print()
+            return False, cmd_count, time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        if journal:
+            print( self.resume_report( skipped, cmd_count ) )
+        if self.quiet:
+            return True, cmd_count, elapsed
+        print()
+        print( "End of file: " + cmd_fname )
+        print( "{} commands in {:.3f} s ({:.1f} commands/s)".format(
+            cmd_count, elapsed, cmd_count / elapsed if elapsed else 0.0 ) )
+        for report in ( self.editor.prepare_report(), self.editor.bulk_report() ):
+            if report:
+                print( report )
+        print()
+        return True, cmd_count, elapsed
+
+    def open_journal( self, cmd_fname ):
+        """
+        Returns the journal of a command file applied to the database.  With
+        the memory backend, it is kept in the session along with the model.
+
+        """
+        if not self.model:
+            return Command_Journal( cmd_fname, self.options.get('dsn', DEFAULT_DSN) )
+        key = os.path.abspath( cmd_fname )
+        if key not in self.journals:
+            self.journals[key] = Command_Journal( cmd_fname, None )
+        return self.journals[key]
+
+    def note_applied( self, count ):
+        """
+        Notes that the next count commands of the file being processed, in
+        order, have been applied, adding them to its journal if it has one.
+        Returns the count.
+
+        """
+        if self.journal:
+            self.journal.advance( count )
+        return count
+
+    def skip_applied( self, journal, numbered ):
+        """
+        Returns the number of commands, a list of ( line number, line ), at
+        the start of a command file that the journal shows were already
+        applied.  Focus commands among them are run, silently, so the rest
+        of the file is translated as it would have been.
+
+        """
+        skipped = journal.applied( numbered )
+        with contextlib.redirect_stdout( io.StringIO() ):
+            for n, line in numbered[:skipped]:
+                if self.is_ui_command( line ) and self.ui_alias[line.split( None, 1 )[UIOP]] == 'focus':
+                    self.translate( line )
+        return skipped
+
+    @staticmethod
+    def resume_report( skipped, executed ):
+        """
+        Returns the summary of a resumed command file.
+
+        """
+        return "Resumed: {} commands skipped as already applied, {} executed".format( skipped, executed )
+
+    def process_bulk( self, cmd_fname, commands, chunk_size ):
+        """
+        Processes the ( line number, line, command ) of each command from a
+        command file.  The command is the translated call, if already known,
+        or None to translate the line here.
+
+        Runs of calls that return nothing are sent in chunks of up to chunk_size,
+        see exec_batch().  A call with output, or a UI command other than focus,
+        is processed on its own once the calls before it have been sent.  With
+        no chunk size, each call is executed on its own.  Stops at the first
+        failure, reporting its line number in the file.
+
+        Returns the number of commands processed and whether all succeeded.
+
+        """
+        chunk = [] # ( line number, line, command ), command is None for focus
+        cmd_count = 0
+        self.kept = 0 # Calls kept from a chunk that failed, see send_chunk()
+        try:
+            for n, line, command in commands:
+                self.echo( line )
+                if command is None and self.is_ui_command( line ):
+                    focus = self.ui_alias[line.split( None, 1 )[UIOP]] == 'focus'
+                    if not focus:
+                        # Focus only affects translation, anything else runs in order
+                        cmd_count += self.send_chunk( cmd_fname, chunk )
+                    self.current_line = line
+                    self.translate( line )
+                    if focus and chunk:
+                        # Counted in its place among the calls, once they are sent
+                        chunk.append( ( n, line, None ) )
+                    else:
+                        cmd_count += self.note_applied( 1 )
+                    continue
+                try:
+                    if command is None:
+                        command = self.translate( line )
+                except mi_Command_Error:
+                    # Everything before the bad line is still applied
+                    cmd_count += self.send_chunk( cmd_fname, chunk )
+                    print( "At line {} of {}".format( n, cmd_fname ) )
+                    raise
+                if command['ovals'] or not chunk_size:
+                    cmd_count += self.send_chunk( cmd_fname, chunk )
+                    self.current_line = line
+                    self.execute( command )
+                    cmd_count += self.note_applied( 1 )
+                    continue
+                chunk.append( ( n, line, command ) )
+                if len( chunk ) >= chunk_size:
+                    cmd_count += self.send_chunk( cmd_fname, chunk )
+            cmd_count += self.send_chunk( cmd_fname, chunk )
+        except ( mi_Command_Error, mi_Quiet_Error ):
+            # Error message has been printed, count any calls kept from a failed chunk
+            self.report_failure()
+            return cmd_count + self.kept, False
+        return cmd_count, True
+
+    def send_chunk( self, cmd_fname, chunk ):
+        """
+        Executes the calls collected by process_bulk() and empties the chunk.
+        Returns the number of commands applied, including any focus commands
+        among the calls.  If a call fails, the number of commands kept before
+        it is left in self.kept.
+
+        """
+        if not chunk:
+            return 0
+        entries = chunk[:]
+        del chunk[:]
+        positions = [ i for i, ( n, line, command ) in enumerate( entries ) if command ]
+        calls = [ entries[i] for i in positions ]
+        start = time.perf_counter()
+        try:
+            self.call_batch( [ command for n, line, command in calls ] )
+        except mi_DB_Error:
+            self.kept = self.note_applied( positions[self.failed_index] )
+            n, self.current_line, command = calls[self.failed_index]
+            print( "At line {} of {}".format( n, cmd_fname ) )
+            raise mi_Quiet_Error()
+        share = ( time.perf_counter() - start ) / len( calls )
+        for n, line, command in calls:
+            self.record_times( command, share, 0.0 )
+        return self.note_applied( len( entries ) )
+
+    def call_batch( self, commands ):
+        """
+        Sends translated calls that return nothing to the database in one
+        round trip, see exec_batch().  If one fails, its position is left in
+        self.failed_index, the calls before it are kept, and the error is
+        raised.
+
+        With the mirror in use, each call is checked and applied tentatively
+        before the chunk is sent, so it sees the names created before it.
+        Only the changes of the calls kept are left applied.
+
+        """
+        self.failed_index = None
+        mirror = self.mirror
+        if mirror:
+            mirror.tentative()
+            for i, c in enumerate( commands ):
+                try:
+                    mirror.check( c['call'], c['pvals'], c['shape'] )
+                except mi_DB_Error:
+                    # Send the calls before the bad one, then report it
+                    mirror.rollback()
+                    if i:
+                        self.call_batch( commands[:i] )
+                    self.failed_index = i
+                    raise
+                mirror.apply( c['call'], c['pvals'], c['shape'] )
+        for c in commands:
+            if self.show_cache:
+                self.show_cache.changed( c['shape'][0] )
+        try:
+            self.editor.exec_batch(
+                    [ ( c['call'], c['pvals'], c['shape'] ) for c in commands ], self.verbose )
+        except mi_DB_Error:
+            self.failed_index = self.editor.failed_index
+            if mirror:
+                mirror.rollback()
+                for c in commands[:self.failed_index]:
+                    mirror.apply( c['call'], c['pvals'], c['shape'] )
+            raise
+        if mirror:
+            mirror.commit()
+        if self.completer:
+            self.completer.changed()
 
     def interact( self ):
         """
@@ -566,9 +1141,8 @@ class Session:
 
         """
         if self.mode == "piped":
-            print()
-            print("--- Processing commands from input pipe ---")
-            print()
+            self.process_piped()
+            return
         else:
             # Print start of session message
             print()
@@ -581,46 +1155,113 @@ class Session:
             print ("<op> <subject> without any args to get required args, ex: new domain")
             print( "h, help for help and q to quit" )
             print()
+            self.init_completion()
 
         # Prompt for commands and process them until a quit command is detected
         while True:
             line = None
             while not line: # ignore blank lines
                 try:
-                    if self.mode == "interactive":
-                        line = input( self.spec.prompt )
-                    else:
-                        line = input()
-                        line = None if line.startswith( COMMENT_CHAR ) else line
+                    line = input( self.spec.prompt )
                 except EOFError:
-                    # We'll get this when processing an input stream
-                    if self.mode == "piped":
-                        print()
-                        print("--- Finished processing input pipe ---")
-                        print()
-                        return
-                    else:
-                        print("Ctrl-D detected.")
-                        print("Bye.")
-                        print()
-                        break
+                    print("Ctrl-D detected.")
+                    print("Bye.")
+                    print()
+                    break
 
             if line in self.exit_commands:
                 print("Bye.")
                 print()
                 break
-            if self.mode != "interactive":
-                print( "* " + line.strip() )
             try:
                 self.process( line )
             except mi_Command_Error:
                 # Error message has been printed, continue to next prompt
                 continue
 
+    def init_completion( self ):
+        """
+        Completes the command being typed when tab is pressed.
+
+        """
+        import readline # Only loaded for interactive sessions, see miuml.py
+        self.completer = Completer( self )
+        readline.set_completer( self.completer.complete )
+        readline.set_completer_delims( "" ) # Model names may contain spaces
+        if 'libedit' in ( readline.__doc__ or "" ):
+            readline.parse_and_bind( "bind ^I rl_complete" )
+        else:
+            readline.parse_and_bind( "tab: complete" )
+
+    def process_piped( self ):
+        """
+        Processes each command from the input pipe.  A failed command is
+        reported and processing continues with the next one, unless pipelined.
+
+        """
+        if not self.quiet:
+            print()
+            print("--- Processing commands from input pipe ---")
+            print()
+        start = time.perf_counter()
+        if self.options.get('pipelined'):
+            # Parse and translate ahead while earlier calls are in flight
+            cmd_count, succeeded = Pipeline( self ).run( self.piped_lines(), blocking_input=True )
+        else:
+            # Lines are read straight from the pipe since input() would flush
+            # the output for every line
+            cmd_count, succeeded = 0, True
+            for line in self.piped_lines():
+                self.echo( line )
+                try:
+                    self.process( line )
+                    cmd_count += 1
+                except ( mi_Command_Error, mi_Quiet_Error ):
+                    # Error message has been printed, continue with the next command
+                    self.report_failure()
+                    succeeded = False
+        if self.quiet:
+            if cmd_count or not succeeded or not self.cmd_files:
+                self.summary( cmd_count, time.perf_counter() - start, "input pipe", succeeded )
+        else:
+            print()
+            print("--- Finished processing input pipe ---")
+            print()
+
+    def piped_lines( self ):
+        """
+        Yields each command read from the input pipe up to any exit command.
+
+        """
+        for line in sys.stdin:
+            line = strip_comment_ws( line )
+            if not line:
+                continue
+            if line in self.exit_commands:
+                return
+            yield line
+
     def process( self, line ):
         """
         Process line
 
+        """
+        command = self.translate( line )
+        if command:
+            self.execute( command )
+
+    def is_ui_command( self, line ):
+        """
+        Returns True if the line is a UI (non-API) command.
+
+        """
+        return line.split( None, 1 )[UIOP] in self.ui_alias
+
+    def translate( self, line ):
+        """
+        Executes a UI command, or translates an App command into an API call
+        which is returned for execution.  Returns None for a UI command.
+
         """
         # Initially assume it is a UI command with two parts <UIOP> <UIARGS>
         term = line.split( None, 1 )
@@ -638,7 +1279,7 @@ class Session:
 
             # Execute the UI command
             self.ui_cmd[term[UIOP]]['func']( self, arg_map )
-            return
+            return None
 
         # Assert: Not a UI command, possibly a legal App command
 
@@ -655,31 +1296,112 @@ class Session:
             term.append( "" ) # to avoid index error later
 
         # Assert term is a list of three elements OP, SUB, ARGS
+        clock = time.perf_counter
+        start = clock()
         arg_map = self.parse_app_args( term[ARGS] )
+        parsed = clock()
         command = self.api.command_to_call( term[SUB], term[OP], arg_map )
+        # Kept until the command is executed, see record_times()
+        command['times'] = [ ( 'parse', parsed - start ), ( 'translate', clock() - parsed ) ]
+        return command
+
+    def execute( self, command ):
+        """
+        Executes a translated API call and prints any result.
+
+        """
+        start = time.perf_counter()
         try:
-            relations, attrs = self.editor.exec_command(
-                    command['call'], command['pvals'], command['ovals'],
-                    self.diagnostic, self.verbose
-                )
+            relations, attrs = self.call( command )
         except mi_DB_Error:
-            if self.mode in {'batch', 'file'}:
+            if self.mode in {'batch', 'file', 'piped'}:
                 raise mi_Quiet_Error()
             return # Non-fatal error was printed
 
+        executed = time.perf_counter()
+        try:
+            self.show_result( relations, attrs ) # Streamed rows are read as printed
+        except mi_DB_Error:
+            if self.mode in {'batch', 'file', 'piped'}:
+                raise mi_Quiet_Error()
+            return
+        finally:
+            self.close_result( relations )
+        self.record_times( command, executed - start, time.perf_counter() - executed )
+
+    def call( self, command ):
+        """
+        Sends a translated API call to the database, unless it is a show command
+        answered by the show cache.  Returns the relations and attrs.
+
+        """
+        cache = None if self.diagnostic else self.show_cache
+        if cache:
+            cached = cache.lookup( command['shape'][0], command['call'], command['pvals'] )
+            if cached:
+                return cached
+        mirror = None if self.diagnostic else self.mirror
+        if mirror:
+            # Reject any unknown domain, subsystem or class name without asking the database
+            mirror.check( command['call'], command['pvals'], command['shape'] )
+        relations, attrs = self.editor.exec_command(
+                command['call'], command['pvals'], command['ovals'],
+                self.diagnostic, self.verbose, command['shape'], command['group']
+            )
+        if mirror:
+            mirror.apply( command['call'], command['pvals'], command['shape'] )
+        if self.completer and not is_read_only( command['shape'][0].split( '_', 1 )[-1] ):
+            self.completer.changed() # Model names may have to be read again
+        if cache and attrs:
+            try:
+                relations = list( relations ) # Any streamed rows are read now to be kept
+            finally:
+                self.close_result( relations )
+            cache.save( command['shape'][0], command['call'], command['pvals'], relations, attrs )
+        return relations, attrs
+
+    @staticmethod
+    def close_result( relations ):
+        """
+        Ends a command whose rows are streamed, undoing it if they weren't
+        all read, see mi_RDB.Row_Stream.
+
+        """
+        if isinstance( relations, mi_RDB.Row_Stream ):
+            relations.close()
+
+    def reload_mirror( self ):
+        """
+        Reads the model names into the mirror, or stops using it if that fails.
+
+        """
+        try:
+            self.mirror.load( self.editor )
+        except mi_Error:
+            print( "Model names will only be checked by the database." )
+            self.mirror = None
+
+    def record_times( self, command, execute, show ):
+        """
+        Records the time taken by each stage of a successfully executed command.
+
+        """
+        self.stats.record( command['group'],
+                command['times'] + [ ( 'execute', execute ), ( 'print', show ) ] )
+
+    def show_result( self, relations, attrs ):
+        """
+        Prints the relations returned by an API call under a header of
+        the returned attribute names.
+
+        """
         if attrs: # Any expected return value?
-            print("<----")
-            hlen = 0
-            for a in attrs:
-                print(a, end="\t")
-                hlen += len(a) + 3
-            else:
-                print()
-                print("="*hlen)
+            write = sys.stdout.write # One write per line
+            rule = "=" * sum( len(a) + 3 for a in attrs ) + "\n"
+            write( "<----\n" + "".join( a + "\t" for a in attrs ) + "\n" + rule )
             for r in relations:
-                print(r)
-            else:
-                print("="*hlen)
+                write( str(r) + "\n" )
+            write( rule )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+
+"""
+Show Result Cache
+
+Keeps the results of recent read only (show) calls so that repeating one
+doesn't cost another database transaction.  The least recently used result
+is dropped once the cache is full.
+
+Each result depends on the subjects named by its call's api definition: the
+subject of the command and the scope of each of its focus args.  Show class,
+for example, depends on class, subsys and domain.  A call that changes the
+model (new, set, del and so on) drops every result that depends on any of its
+own subjects.
+
+Changes made by anyone other than this session are not seen, so the cache
+is only used when requested.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+from collections import OrderedDict
+
+DEFAULT_SIZE = 256 # results
+
+def is_read_only( api_call ):
+    """
+    Returns True if the api call only reads the model, ex: get_classes.
+
+    """
+    return api_call.startswith( 'get' )
+
+class Show_Cache:
+    """
+    Show Result Cache
+
+    """
+    def __init__( self, api, size=DEFAULT_SIZE ):
+        self.size = size
+        self.entries = OrderedDict() # ( call, pvals ) : ( relations, attrs, subjects ), oldest first
+        self.dependents = {} # subject : { key of each result depending on it }
+        self.hits = 0
+        self.misses = 0
+
+        # api function : ( is read only, subjects it depends on or changes )
+        self.calls = {}
+        for s, subject in api.commands.items():
+            for op_spec in subject['ops'].values():
+                subjects = { s } | { a['scope'] for a in op_spec['args'].values() if a.get('scope') }
+                self.calls[api.call_prefix + op_spec['api_call']] = (
+                        is_read_only( op_spec['api_call'] ), frozenset( subjects )
+                    )
+
+    def lookup( self, api_name, call, pvals ):
+        """
+        Returns the cached ( relations, attrs ) of a read only call, or None.
+        A call that changes the model drops the results depending on it.
+
+        """
+        if self.changed( api_name ):
+            return None
+        entry = self.entries.get( ( call, tuple( pvals ) ) )
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end( ( call, tuple( pvals ) ) )
+        return entry[0], entry[1]
+
+    def changed( self, api_name ):
+        """
+        If the call changes the model, drops the results depending on it and
+        returns True.
+
+        """
+        read_only, subjects = self.calls.get( api_name, ( False, None ) )
+        if not read_only:
+            self.invalidate( subjects )
+        return not read_only
+
+    def save( self, api_name, call, pvals, relations, attrs ):
+        """
+        Keeps the result of a read only call, dropping the least recently used
+        result if the cache is full.
+
+        """
+        read_only, subjects = self.calls.get( api_name, ( False, None ) )
+        if not read_only or self.size <= 0:
+            return
+        key = ( call, tuple( pvals ) )
+        if key not in self.entries and len( self.entries ) >= self.size:
+            oldest, entry = self.entries.popitem( last=False )
+            self.forget( oldest, entry[2] )
+        self.entries[key] = ( relations, attrs, subjects )
+        for s in subjects:
+            self.dependents.setdefault( s, set() ).add( key )
+
+    def forget( self, key, subjects ):
+        """
+        Removes a dropped result from the dependents of its subjects.
+
+        """
+        for s in subjects:
+            keys = self.dependents.get( s )
+            if keys:
+                keys.discard( key )
+
+    def invalidate( self, subjects=None ):
+        """
+        Drops the results depending on any of the subjects, or on anything
+        if the subjects are unknown.
+
+        """
+        if subjects is None:
+            self.clear()
+            return
+        for s in subjects:
+            for key in self.dependents.pop( s, () ):
+                entry = self.entries.pop( key, None )
+                if entry:
+                    self.forget( key, entry[2] )
+
+    def clear( self ):
+        self.entries.clear()
+        self.dependents = {}
+
+    def report( self ):
+        """
+        Returns a summary of cache use.
+
+        """
+        lookups = self.hits + self.misses
+        return "show cache: {} hits, {} misses ({:.1f}% hit rate), {} of {} results held".format(
+                self.hits, self.misses, 100.0 * self.hits / lookups if lookups else 0.0,
+                len( self.entries ), self.size )
+
+    def reset( self ):
+        self.hits = 0
+        self.misses = 0
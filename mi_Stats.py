@@ -0,0 +1,150 @@
+#! /usr/bin/env python
+
+"""
+Command Latency Statistics
+
+Collects the time spent in each stage of processing a command, such as
+parsing, translation, the server call and printing, grouped by the subject
+and op of the command.  Each group and stage keeps a histogram of its
+latencies so that percentiles can be reported without keeping every sample.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import json
+import math
+import threading
+
+# Histogram buckets grow by a factor of 2^(1/BUCKETS_PER_DOUBLING) starting
+# at MIN_LATENCY, so a percentile is reported within about 10% of its value
+MIN_LATENCY = 1e-6 # seconds
+BUCKETS_PER_DOUBLING = 8
+
+PERCENTILES = ( 50, 95, 99 )
+
+# Stages in the order they happen, others are reported after these
+STAGE_ORDER = ( 'parse', 'translate', 'execute', 'defer', 'prepare',
+        'server', 'fetch', 'commit', 'print' )
+
+def bucket_bound( bucket ):
+    """
+    Returns the upper bound, in seconds, of a histogram bucket.
+
+    """
+    return MIN_LATENCY * 2 ** ( ( bucket + 1 ) / BUCKETS_PER_DOUBLING )
+
+class Latency_Stats:
+    """
+    Latency Statistics
+
+    Safe to share among threads.
+
+    """
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.groups = {} # group : { stage : [ count, total, max, { bucket : count } ] }
+
+    def record( self, group, stages ):
+        """
+        Adds the ( stage, seconds ) timings of one command to its group.
+
+        """
+        with self.lock:
+            group_stats = self.groups.get( group )
+            if group_stats is None:
+                group_stats = self.groups[group] = {}
+            for stage, seconds in stages:
+                s = group_stats.get( stage )
+                if s is None:
+                    s = group_stats[stage] = [ 0, 0.0, 0.0, {} ]
+                s[0] += 1
+                s[1] += seconds
+                if seconds > s[2]:
+                    s[2] = seconds
+                bucket = int( math.log2( seconds / MIN_LATENCY ) * BUCKETS_PER_DOUBLING ) \
+                    if seconds > MIN_LATENCY else 0
+                s[3][bucket] = s[3].get( bucket, 0 ) + 1
+
+    def reset( self ):
+        with self.lock:
+            self.groups = {}
+
+    @staticmethod
+    def percentile( s, p ):
+        """
+        Returns the latency, in seconds, that p percent of a stage's samples fall within.
+
+        """
+        count, total, longest, histogram = s
+        rank = math.ceil( count * p / 100 )
+        seen = 0
+        for bucket in sorted( histogram ):
+            seen += histogram[bucket]
+            if seen >= rank:
+                return min( bucket_bound( bucket ), longest )
+        return longest
+
+    def summary( self ):
+        """
+        Returns { group : { stage : statistics } } with times in microseconds.
+
+        """
+        with self.lock:
+            groups = { g:{ stage:list( s ) for stage, s in stages.items() }
+                for g, stages in self.groups.items() }
+        result = {}
+        for g, stages in groups.items():
+            result[g] = {}
+            for stage, s in stages.items():
+                summary = { 'count':s[0], 'total_us':s[1] * 1e6,
+                    'mean_us':s[1] / s[0] * 1e6, 'max_us':s[2] * 1e6 }
+                for p in PERCENTILES:
+                    summary['p{}_us'.format( p )] = self.percentile( s, p ) * 1e6
+                result[g][stage] = summary
+        return result
+
+    def report( self ):
+        """
+        Prints the statistics, busiest group first.
+
+        """
+        summary = self.summary()
+        if not summary:
+            print( "No commands timed." )
+            return
+        order = { stage:i for i, stage in enumerate( STAGE_ORDER ) }
+        header = "{:<24}{:<11}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            "command", "stage", "count", "total ms", "mean us", "p50 us", "p95 us", "p99 us", "max us" )
+        print( header )
+        print( "=" * len( header ) )
+        busiest = sorted( summary, key=lambda g: -sum( s['total_us'] for s in summary[g].values() ) )
+        for g in busiest:
+            label = g # Only the first stage of each group is labeled
+            for stage in sorted( summary[g], key=lambda stage: ( order.get( stage, len( order ) ), stage ) ):
+                s = summary[g][stage]
+                print( "{:<24}{:<11}{:>8}{:>12.2f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                    label, stage, s['count'], s['total_us'] / 1000, s['mean_us'],
+                    s['p50_us'], s['p95_us'], s['p99_us'], s['max_us'] ) )
+                label = ""
+        print( "=" * len( header ) )
+
+    def dump( self, fname ):
+        """
+        Writes the statistics to the named file as JSON.
+
+        """
+        with open( fname, 'w' ) as f:
+            json.dump( self.summary(), f, indent=4, sort_keys=True )
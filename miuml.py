@@ -23,7 +23,9 @@ editing session.
 
 # System
 import os
-import readline
+import time
+
+startup_start = time.perf_counter() # For the -startup-profile breakdown
 
 # Go to real code file directory, in case invoked by symbolic link
 # so we can find required relative parent/sibling directories
@@ -41,30 +43,77 @@ launch_dir = os.getcwd()
 # a symbolic link.
 os.chdir( os.path.dirname( os.path.realpath(__file__) ) )
 
+# A client only forwards commands to a running daemon, see mi_Client, so
+# it doesn't load the rest of the editor
+if __name__ == '__main__':
+    import sys
+    if '-client' in sys.argv[1:]:
+        import mi_Client
+        exit( mi_Client.main( [ a for a in sys.argv[1:] if a != '-client' ], launch_dir ) )
+
 # Local
 from mi_API import API
 from mi_Session import Session
+from mi_Profile import Startup_Profile
 
-# Diagnostic
-import pdb
+imports_done = time.perf_counter()
 
 # Constants
 READLINE_INIT_FILE = ".inputrc"
 
-# Set up readline
-readline.read_init_file( os.path.join( os.path.expanduser('~'), READLINE_INIT_FILE ) )
+def option_value( args, flag, convert=str ):
+    """
+    Removes a command line option and its value from args, returning the
+    converted value or None if the option is absent.
+
+    """
+    if flag not in args:
+        return None
+    i = args.index( flag )
+    try:
+        value = convert( args[i + 1] )
+    except ( IndexError, ValueError ):
+        print( "Option {} requires a valid value.".format( flag ) )
+        exit(2)
+    del args[i:i + 2]
+    return value
 
 interactive = False
 cmd_files = None
 piped_input = False
 diagnostic = False
 verbose = False
+options = {} # Additional command line options passed through to the Session
 
 if __name__ == '__main__':
     # Process command line args
     from sys import argv, stdin
     if not stdin.isatty():
         piped_input = True
+    args = argv[1:]
+    jobs = option_value( args, '-j', int )
+    if jobs:
+        # Process up to this many command files at the same time
+        options['jobs'] = jobs
+    # Database connection string and connection pool size
+    for flag, option, convert in ( ( '-backend', 'backend', str ), ( '-dsn', 'dsn', str ),
+            ( '-pool-min', 'pool_min', int ), ( '-pool-max', 'pool_max', int ),
+            ( '-fetch', 'fetch_size', int ), ( '-show-cache', 'show_cache', int ),
+            ( '-bulk', 'bulk', int ) ):
+        value = option_value( args, flag, convert )
+        if value is not None:
+            options[option] = value
+    socket_path = option_value( args, '-socket' )
+    if socket_path:
+        # Where the daemon listens
+        options['socket'] = os.path.abspath( os.path.join( launch_dir, socket_path ) )
+    stats_file = option_value( args, '-stats' )
+    if stats_file:
+        # Write the time spent in each stage of each command as JSON on exit
+        options['stats_file'] = os.path.abspath( os.path.join( launch_dir, stats_file ) )
+    if options.get('backend', 'postgres') not in ( 'postgres', 'memory' ):
+        print( "Backend must be postgres or memory." )
+        exit(2)
     if len(argv) > 1:
         if '-i' in argv[1:]:
             interactive = True
@@ -72,15 +121,63 @@ if __name__ == '__main__':
             diagnostic = True
         if '-v' in argv[1:]:
             verbose = True
+        if '-tx' in argv[1:]:
+            # Apply each command file in a single transaction
+            options['transaction'] = True
+        if '-coalesce' in argv[1:]:
+            # Send runs of bulk calls of the same kind as one statement (experimental)
+            options['coalesce'] = True
+        if '-async' in argv[1:]:
+            # Pipeline batch and piped commands, parsing ahead of the database
+            options['pipelined'] = True
+        if '-q' in argv[1:] or '--quiet' in argv[1:]:
+            # Only report failures and a summary, through a buffered writer
+            options['quiet'] = True
+            options['buffered'] = True
+        if '-buffered' in argv[1:]:
+            # Write output in blocks rather than a line at a time
+            options['buffered'] = True
+        if '-mirror' in argv[1:]:
+            # Check domain, subsystem and class names before calling the database
+            options['mirror'] = True
+        if '-check' in argv[1:]:
+            # Translate every line of every command file before running any
+            options['check'] = True
+        if '-compile' in argv[1:]:
+            # Compile the command files for replay without running them
+            options['compile'] = True
+        if '-replay' in argv[1:]:
+            # Run command files from their compiled calls, compiling them if needed
+            options['replay'] = True
+        if '-resume' in argv[1:]:
+            # Skip the commands of each file applied by an earlier run
+            options['resume'] = True
+        if '-daemon' in argv[1:]:
+            # Run the commands sent by clients until stopped, see mi_Daemon
+            options['daemon'] = True
+        if '-startup-profile' in argv[1:]:
+            # Print a timing breakdown of the startup phases
+            options['startup_profile'] = Startup_Profile( startup_start )
+            options['startup_profile'].mark( "imports", imports_done )
         # Make a list of absolute path names relative to the launch
         # directory for each command file provided
         cmd_files = [
                 os.path.abspath( os.path.join( launch_dir,f ) )
-                for f in argv[1:] if not f.startswith('-')
+                for f in args if not f.startswith('-')
             ]
 
+# Readline is only needed if we will be prompting at the terminal,
+# so scripted runs don't pay for loading it
+if interactive or not ( cmd_files or piped_input or options.get('daemon') ):
+    import readline
+    readline_init_file = os.path.join( os.path.expanduser('~'), READLINE_INIT_FILE )
+    if os.path.exists( readline_init_file ):
+        readline.read_init_file( readline_init_file )
+    if 'startup_profile' in options:
+        options['startup_profile'].mark( "readline" )
+
 # Launch an interactive editing session
 Session( launch_dir,
     ("miUML Editor", "UI_", os.path.join( "Resources", "api_def.mi" )),
-    cmd_files, interactive, piped_input, diagnostic, verbose
+    cmd_files, interactive, piped_input, diagnostic, verbose, options
 )
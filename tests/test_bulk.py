@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+
+"""
+Bulk Submission Tests
+
+Runs the editor on command files with the in memory backend, so no database
+is needed, and checks what it reports, and journals, when a chunk of calls fails part
+way.
+
+"""
+# --
+# Copyright 2012, Model Integration, LLC
+# Developer: Leon Starr / leon_starr@modelint.com
+
+# This file is part of the miUML metamodel library.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.  The license text should be viewable at
+# http://www.gnu.org/licenses/
+# --
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# System
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+
+EDITOR = os.path.join( os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ), "miuml.py" )
+
+# 3 setup commands and 15 classes, then a duplicate class in the fourth
+# chunk of 5, after 18 commands have been applied
+FAILING_SCRIPT = [ "new domain -name Bulk -alias BLK", "focus -s domain -v Bulk",
+        "focus -s subsys -v Main" ] + \
+    [ "new class -name C{0} -alias C{0}".format( i ) for i in range( 1, 16 ) ] + \
+    [ "new class -name C3 -alias C3X" ] + \
+    [ "new class -name C{0} -alias C{0}".format( i ) for i in range( 16, 20 ) ]
+APPLIED = 18
+
+def run_editor( args, script, commands=None ):
+    """
+    Runs the editor on a temporary command file, script.mi, holding the
+    script lines, returning its output.  If commands are given, they are
+    piped in instead, run from the directory of the command file.
+
+    """
+    with tempfile.TemporaryDirectory() as d:
+        with open( os.path.join( d, "script.mi" ), 'w' ) as f:
+            f.write( "\n".join( script ) + "\n" )
+        files = [] if commands else [ "script.mi" ]
+        result = subprocess.run( [ sys.executable, EDITOR ] + args + files,
+                input="\n".join( commands or [] ) + "\n", cwd=d,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True )
+    return result.stdout
+
+class Test_Bulk( unittest.TestCase ):
+
+    def test_failed_chunk_count( self ):
+        # The calls kept before the failure are counted
+        out = run_editor( [ '-backend', 'memory', '-bulk', '5', '-q' ], FAILING_SCRIPT )
+        self.assertIn( "At line {} of".format( APPLIED + 1 ), out )
+        self.assertIn( "{} commands from 1 of 1 files".format( APPLIED ), out )
+        self.assertIn( "FAILED", out )
+
+    def test_failed_chunk_journal( self ):
+        # The calls kept before the failure are journaled and skipped when resumed
+        out = run_editor( [ '-backend', 'memory', '-bulk', '5', '-q', '-resume' ], FAILING_SCRIPT,
+                [ "read -f script.mi" ] * 2 )
+        self.assertIn( "Resumed: 0 commands skipped as already applied, {} executed".format( APPLIED ), out )
+        self.assertIn( "Resumed: {} commands skipped as already applied, 0 executed".format( APPLIED ), out )
+
+if __name__ == '__main__':
+    unittest.main()